@@ -1,23 +1,48 @@
+import base64
+import copy
+import itertools
+import gzip
+import hashlib
 import json
 import os
+import pickle
+import queue
+import threading
+import time
 import uuid
 import secrets
-from datetime import datetime, timedelta
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
 import bcrypt
 import jwt
+from cachetools import LRUCache, TTLCache
 import numpy as np
 import pandas as pd
-import tensorflow as tf
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, has_request_context
 from flask_mail import Mail, Message
 from google.cloud import storage
 from google.oauth2 import service_account
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import requests
+from requests.adapters import HTTPAdapter
 import firebase_admin
 from firebase_admin import credentials, firestore
+from image_processing import build_variants
+from inference import BACKENDS, MODEL_NAMES, file_md5, load_model, model_filename
+import columnar
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Initialize Flask
 app = Flask(__name__)
@@ -29,6 +54,22 @@ if not os.getenv('SECRET_KEY'):
     with open('.env', 'a') as f:
         f.write(f"\nSECRET_KEY={app.config['SECRET_KEY']}")
 
+# Process roles. A 'web' process serves HTTP. With MODEL_SERVER_ADDRESS set (see
+# gunicorn.conf.py) web workers leave the models and dataset parsing to the single
+# 'model-server' process (model_server.py): they call it over a local socket for
+# inference, memory-map the dataset columns it writes to SHARED_DATASET_DIR and
+# load the match index and serialized responses it derived from them.
+# A 'script' process (the maintenance scripts, and spawned pool workers re-importing
+# this file as __mp_main__) only uses the clients and helpers: no background
+# threads are started and artifacts are loaded only when it calls reload_artifacts().
+APP_ROLE = 'script' if __name__ == '__mp_main__' else os.getenv('APP_ROLE', 'web')
+MODEL_SERVER_ADDRESS = os.getenv('MODEL_SERVER_ADDRESS')
+MODEL_SERVER_AUTHKEY = (os.getenv('MODEL_SERVER_AUTHKEY') or app.config['SECRET_KEY']).encode('utf-8')
+MODEL_SERVER_POLL_INTERVAL = float(os.getenv('MODEL_SERVER_POLL_INTERVAL', 5))
+MODEL_SERVER_TIMEOUT = float(os.getenv('MODEL_SERVER_TIMEOUT', 10))
+SHARED_DATASET_DIR = os.getenv('SHARED_DATASET_DIR', '/tmp/dataset_columns')
+use_model_server = APP_ROLE == 'web' and bool(MODEL_SERVER_ADDRESS)
+
 # Mail configuration
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
@@ -38,6 +79,170 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 
 mail = Mail(app)
 
+# Background mail delivery
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', 2))
+MAIL_MAX_RETRIES = int(os.getenv('MAIL_MAX_RETRIES', 3))
+MAIL_RETRY_BACKOFF = float(os.getenv('MAIL_RETRY_BACKOFF', 1))
+MAIL_IDLE_SECONDS = float(os.getenv('MAIL_IDLE_SECONDS', 30))
+
+class MailQueue:
+    """Deliver mail from background workers instead of the request thread.
+
+    Each worker keeps its SMTP connection open across messages, closes it after
+    idle_seconds without work, and retries a failed send with exponential backoff
+    on a fresh connection.
+    """
+
+    def __init__(self, mail, workers=MAIL_WORKERS, max_retries=MAIL_MAX_RETRIES,
+                 backoff=MAIL_RETRY_BACKOFF, idle_seconds=MAIL_IDLE_SECONDS):
+        self.mail = mail
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_seconds = idle_seconds
+        self.pending = queue.Queue()
+        self.workers = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        self.started = False
+        self.start_lock = threading.Lock()
+
+    def enqueue(self, msg):
+        # Workers start with the first message, so processes that never send mail have none
+        with self.start_lock:
+            if not self.started:
+                for worker in self.workers:
+                    worker.start()
+                self.started = True
+        self.pending.put(msg)
+
+    def _disconnect(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
+
+    def _run(self):
+        connection = None
+        with app.app_context():
+            while True:
+                try:
+                    msg = self.pending.get(timeout=self.idle_seconds)
+                except queue.Empty:
+                    connection = self._disconnect(connection)
+                    continue
+
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if connection is None:
+                            connection = self.mail.connect().__enter__()
+                        connection.send(msg)
+                        break
+                    except Exception as e:
+                        print(f"Mail send error (attempt {attempt + 1}): {e}")
+                        connection = self._disconnect(connection)
+                        if attempt < self.max_retries:
+                            time.sleep(self.backoff * 2 ** attempt)
+                else:
+                    print(f"Giving up on mail to {', '.join(msg.recipients)}")
+
+mail_queue = MailQueue(mail)
+
+# Password hashing: bcrypt runs in worker processes so a login burst cannot starve
+# the request threads; at most PASSWORD_MAX_PENDING operations may be queued
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', 2))
+PASSWORD_MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', PASSWORD_WORKERS * 4))
+PASSWORD_TIMEOUT = float(os.getenv('PASSWORD_TIMEOUT', 10))
+
+class SpawnPool:
+    """A process pool for CPU-bound work, started on first use.
+
+    Workers are spawned rather than forked from this multi-threaded process. A
+    pool broken by a dying worker (e.g. OOM-killed) is dropped, so the call that
+    hit it fails but the next one starts a fresh pool.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self.pool
+
+    def _discard(self, pool):
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _check(self, pool, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            print(f"Process pool broken, replacing it: {future.exception()}")
+            self._discard(pool)
+
+    def submit(self, fn, *args):
+        pool = self._get()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # Broke since the last call finished; nothing of this call ran yet
+            self._discard(pool)
+            pool = self._get()
+            future = pool.submit(fn, *args)
+        future.add_done_callback(lambda done: self._check(pool, done))
+        return future
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool already has a full queue."""
+
+class PasswordHasher:
+    """Hash and check passwords with bcrypt in a spawned process pool.
+
+    Operations beyond max_pending in flight are rejected immediately with
+    PasswordHasherBusy instead of queueing behind a burst.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING,
+                 rounds=BCRYPT_ROUNDS, timeout=PASSWORD_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pool = SpawnPool(workers)
+
+    def _run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self.pool.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def check(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """True when a stored $2b$<cost>$... hash was made with a different cost factor."""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+password_hasher = PasswordHasher()
+
 # Firebase initialization
 try:
     if os.path.exists('serviceAccountKey.json'):
@@ -68,103 +273,928 @@ except Exception as e:
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 
+# Uploads larger than this are rejected while the request body is read. The body
+# limit is set on the upload request only, other routes keep Flask's default
+PROFILE_PICTURE_MAX_BYTES = int(os.getenv('PROFILE_PICTURE_MAX_BYTES', 5 * 1024 * 1024))
+PROFILE_PICTURE_MAX_REQUEST_BYTES = PROFILE_PICTURE_MAX_BYTES + 64 * 1024
+PROFILE_PICTURE_CHUNK_SIZE = 1024 * 1024
+
+# Square WebP variants stored for every profile picture (edge length in pixels)
+PROFILE_PICTURE_SIZES = {'small': 64, 'medium': 256, 'large': 512}
+# Variant returned as the single profile_picture URL for older clients
+PROFILE_PICTURE_DEFAULT_SIZE = 'large'
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_PROCESSING_TIMEOUT = float(os.getenv('IMAGE_PROCESSING_TIMEOUT', 30))
+
+# Image encoding is CPU bound, so it runs in worker processes. Under gunicorn they
+# import only image_processing; under `python app.py` spawn also re-imports the
+# main script (as __mp_main__) in every worker.
+image_pool = SpawnPool(IMAGE_WORKERS)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class BlobDeleter:
+    """Delete superseded blobs in the background, grouping deletes into batch requests.
+
+    Each job names a prefix and removes every blob under it created before a
+    cutoff, except those under the keep prefix, so a newer concurrent upload is
+    never removed.
+    """
+
+    BATCH_WAIT_SECONDS = 2
+    MAX_BATCH_SIZE = 100  # Cloud Storage batch request limit
+
+    def __init__(self):
+        self.pending = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.started = False
+        self.start_lock = threading.Lock()
+
+    def enqueue(self, prefix, before, keep=None):
+        with self.start_lock:
+            if not self.started:
+                self.worker.start()
+                self.started = True
+        self.pending.put((prefix, before, keep))
+
+    def _collect(self):
+        jobs = [self.pending.get()]
+        deadline = time.monotonic() + self.BATCH_WAIT_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return jobs
+            try:
+                jobs.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            try:
+                # Several uploads by the same user can supersede the same blob
+                doomed = {}
+                for prefix, before, keep in jobs:
+                    for blob in bucket.list_blobs(prefix=prefix):
+                        if keep and blob.name.startswith(keep):
+                            continue
+                        if blob.time_created is not None and blob.time_created < before:
+                            doomed[blob.name] = blob
+                doomed = list(doomed.values())
+                for start in range(0, len(doomed), self.MAX_BATCH_SIZE):
+                    with bucket.client.batch():
+                        for blob in doomed[start:start + self.MAX_BATCH_SIZE]:
+                            blob.delete()
+                if doomed:
+                    print(f"Deleted {len(doomed)} superseded blobs")
+            except Exception as e:
+                print(f"Error deleting superseded blobs: {e}")
+
+blob_deleter = BlobDeleter()
+
 def upload_profile_picture(file, user_id):
+    """Store WebP variants of an uploaded picture and schedule cleanup of the previous ones.
+
+    Returns a dict of variant name to public URL, or None for a missing or
+    disallowed file. Raises ValueError when the file is not a readable image.
+    """
     try:
         if not file or not allowed_file(file.filename):
             print(f"File validation failed: {file.filename if file else 'No file'}")
             return None
         
-        # Delete existing profile pictures for this user
-        blobs = bucket.list_blobs(prefix=f"profile_pictures/{user_id}/")
-        for blob in blobs:
-            print(f"Deleting existing profile picture: {blob.name}")
-            blob.delete()
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        if size > PROFILE_PICTURE_MAX_BYTES:
+            raise RequestEntityTooLarge()
+
+        # The original is copied to disk in PROFILE_PICTURE_CHUNK_SIZE chunks and the
+        # worker reads it from there, so it is never held in memory or pickled whole
+        with tempfile.NamedTemporaryFile(prefix='profile-picture-') as original:
+            shutil.copyfileobj(stream, original, PROFILE_PICTURE_CHUNK_SIZE)
+            original.flush()
+            variants = image_pool.submit(
+                build_variants, original.name, PROFILE_PICTURE_SIZES
+            ).result(timeout=IMAGE_PROCESSING_TIMEOUT)
+
+        # Variants of one upload share a folder so cleanup can keep them together
+        prefix = f"profile_pictures/{user_id}/{str(uuid.uuid4())}/"
+        print(f"Attempting to upload to: {prefix}")
+
+        def upload_variant(name):
+            blob = bucket.blob(f"{prefix}{name}.webp")
+            # Object names are never reused, so clients may cache them for good
+            blob.cache_control = 'public, max-age=31536000, immutable'
+            # Variants are at most a few dozen KB, a single request each
+            blob.upload_from_string(variants[name], content_type='image/webp', predefined_acl='publicRead')
+            return blob
+
+        with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+            blobs = dict(zip(variants, pool.map(upload_variant, variants)))
+        urls = {name: blob.public_url for name, blob in blobs.items()}
+        uploaded_at = min((blob.time_created for blob in blobs.values() if blob.time_created), default=None)
+        print(f"Upload completed, original size: {size} bytes")
         
-        # Create a unique filename
-        original_extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"profile_pictures/{user_id}/{str(uuid.uuid4())}.{original_extension}"
-        print(f"Attempting to upload to: {filename}")
-        
-        # Upload to Cloud Storage
-        blob = bucket.blob(filename)
-        print(f"Created blob: {blob.name}")
-        
-        file_content = file.read()
-        print(f"Read file content, size: {len(file_content)} bytes")
-        
-        blob.upload_from_string(
-            file_content,
-            content_type=file.content_type
+        blob_deleter.enqueue(
+            f"profile_pictures/{user_id}/",
+            before=uploaded_at or datetime.now(timezone.utc),
+            keep=prefix
         )
-        print("Upload completed")
-        
-        blob.make_public()
-        
-        public_url = blob.public_url
-        print(f"Generated public URL: {public_url}")
         
-        return public_url
+        return urls
     except Exception as e:
         print(f"Upload error: {str(e)}")
         raise
 
-def download_from_gcs(bucket_name, blob_path, local_path):
+def download_from_gcs(blob_path, local_path, known_generation=None):
+    """Download blob_path through the shared bucket client unless local_path already matches it.
+
+    Returns the object's generation once local_path holds it, or None on failure.
+    """
     try:
-        print(f"Attempting to download {blob_path} from bucket {bucket_name} to {local_path}")
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_path)
-        blob.download_to_filename(local_path)
+        blob = bucket.get_blob(blob_path)
+        if blob is None:
+            print(f"{blob_path} not found in bucket {BUCKET_NAME}")
+            return None
+
+        if os.path.exists(local_path):
+            if known_generation is not None and blob.generation == known_generation:
+                return blob.generation
+            if blob.md5_hash:
+                local_md5 = base64.b64encode(bytes.fromhex(file_md5(local_path))).decode()
+                if local_md5 == blob.md5_hash:
+                    print(f"{local_path} is up to date with {blob_path}, skipping download")
+                    return blob.generation
+
+        print(f"Attempting to download {blob_path} from bucket {BUCKET_NAME} to {local_path}")
+        # Download next to the target and rename, so readers never see a partial file
+        partial_path = f"{local_path}.part"
+        blob.download_to_filename(partial_path)
+        os.replace(partial_path, local_path)
         print(f"Successfully downloaded {blob_path} to {local_path}")
+        return blob.generation
     except Exception as e:
         print(f"Error downloading {blob_path}: {e}")
+        return None
 
-# Model and dataset paths in Cloud Storage
-HISTORY_MODEL_BLOB_PATH = "models/history.h5"
-COLDSTART_MODEL_BLOB_PATH = "models/cold_start.h5"
+# Dataset path in Cloud Storage; model paths come from model_paths()
 DATASET_BLOB_PATH = "data/dataset.csv"
 
-# Local temporary paths for downloaded files
-HISTORY_MODEL_PATH = "/tmp/history.h5"
-COLDSTART_MODEL_PATH = "/tmp/cold_start.h5"
+# Local temporary path for the downloaded dataset
 DATASET_PATH = "/tmp/dataset.csv"
 
-# Download files from Cloud Storage before loading
-download_from_gcs(BUCKET_NAME, HISTORY_MODEL_BLOB_PATH, HISTORY_MODEL_PATH)
-download_from_gcs(BUCKET_NAME, COLDSTART_MODEL_BLOB_PATH, COLDSTART_MODEL_PATH)
-download_from_gcs(BUCKET_NAME, DATASET_BLOB_PATH, DATASET_PATH)
-
-# Check model and dataset availability
-USE_DUMMY = not all(os.path.exists(path) for path in [HISTORY_MODEL_PATH, COLDSTART_MODEL_PATH, DATASET_PATH])
-
-# Load dataset globally
-try:
-    dataset = pd.read_csv(DATASET_PATH)
-    dataset['Score tim home'] = dataset['Score tim home'].fillna(0).astype(int)
-    dataset['Score tim away'] = dataset['Score tim away'].fillna(0).astype(int)
-except Exception as e:
-    print(f"Error loading dataset: {e}")
-    dataset = pd.DataFrame()
+# Prebuilt column files (build_dataset.py), preferred over parsing the CSV
+DATASET_COLUMNS_BLOB_PATH = "data/dataset.columns.zip"
+DATASET_COLUMNS_PATH = "/tmp/dataset.columns.zip"
+DATASET_SOURCES = {
+    'columns': (DATASET_COLUMNS_BLOB_PATH, DATASET_COLUMNS_PATH),
+    'csv': (DATASET_BLOB_PATH, DATASET_PATH)
+}
+
+# Model format served; converted files (see convert_models.py) sit next to the
+# .h5 originals in models/, and the Keras originals are the fallback
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras')
+if INFERENCE_BACKEND not in BACKENDS:
+    print(f"Unknown INFERENCE_BACKEND {INFERENCE_BACKEND}, using keras")
+    INFERENCE_BACKEND = 'keras'
+
+def model_paths(backend):
+    """(blob path, local path) of each model file, in MODEL_NAMES order."""
+    return [(f"models/{model_filename(name, backend)}", f"/tmp/{model_filename(name, backend)}")
+            for name in MODEL_NAMES]
+
+# Dataset columns grouped by how they are cleaned at load time
+DATASET_INT_COLUMNS = ['ID Match', 'Score tim home', 'Score tim away', 'Jumlah Tiket Terjual']
+DATASET_TEXT_COLUMNS = ['Match', 'Waktu', 'Hari', 'Tanggal', 'Jam']
+DATASET_CATEGORY_COLUMNS = ['Home', 'Away', 'Stadion', 'Lokasi']
+
+def parse_match_dates(values):
+    # Tanggal comes in as either dd/mm/YYYY or dd-mm-YYYY
+    values = pd.Series(values, dtype=object).astype(str).str.strip()
+    dates = pd.to_datetime(values, format='%d/%m/%Y', errors='coerce')
+    fallback = pd.to_datetime(values, format='%d-%m-%Y', errors='coerce')
+    return dates.fillna(fallback).to_numpy(dtype='datetime64[D]')
+
+def normalize_dataset(df):
+    """Clean the raw CSV once so request handlers only read typed columns."""
+    df = df.copy()
+    for column in DATASET_INT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(int)
+    for column in DATASET_TEXT_COLUMNS + DATASET_CATEGORY_COLUMNS:
+        df[column] = df[column].fillna('').astype(str).str.strip()
+    df['Jam'] = df['Jam'].str.rsplit(':', n=1).str[0]
+    df['Tanggal Parsed'] = parse_match_dates(df['Tanggal'])
+    for column in DATASET_CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+# Micro-batching for model inference
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 5))
+
+class BatchPredictor:
+    """Run concurrent single-sample predict calls for one model as batched forward passes.
+
+    Request threads block in predict() while a worker thread collects samples for
+    up to max_wait_ms (or until max_batch_size is reached), calls model.predict
+    once on the stacked batch, and hands each caller its own row back.
+    """
+
+    def __init__(self, model, max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.closed = False
+        self.close_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def predict(self, sample, timeout=None):
+        """Predict for one sample; returns an array with a leading batch dimension of 1."""
+        future = Future()
+        with self.close_lock:
+            closed = self.closed
+            if not closed:
+                self.pending.put((sample, future))
+        if closed:
+            # A request still holding an older snapshot; the model stays loaded
+            # for as long as anything references this predictor
+            return self.model.predict(np.array([sample]))
+        return future.result(timeout)
+
+    def close(self):
+        """Stop the worker once the samples queued so far have been served.
+
+        Later predict calls run unbatched on the caller's thread.
+        """
+        with self.close_lock:
+            self.closed = True
+            self.pending.put(None)
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stopping = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._predict_batch(batch)
+            if stopping:
+                return
+
+    def _predict_batch(self, batch):
+        try:
+            predictions = self.model.predict(np.array([sample for sample, _ in batch]))
+        except Exception as e:
+            print(f"Batch prediction error: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for i, (_, future) in enumerate(batch):
+            future.set_result(predictions[i:i + 1])
+
+def call_model_server(message, connection=None, timeout=MODEL_SERVER_TIMEOUT):
+    """Send one message to the model server and return its reply payload.
+
+    Uses the given connection or a short-lived one; raises RuntimeError for
+    errors reported by the server and TimeoutError when it does not answer.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = Client(MODEL_SERVER_ADDRESS, family='AF_UNIX', authkey=MODEL_SERVER_AUTHKEY)
+    try:
+        connection.send(message)
+        if timeout is not None and not connection.poll(timeout):
+            raise TimeoutError('Model server did not answer in time')
+        status, payload = connection.recv()
+    finally:
+        if own_connection:
+            connection.close()
+    if status != 'ok':
+        raise RuntimeError(payload)
+    return payload
+
+class RemoteModel:
+    """model.predict(batch) on the model server, for batch jobs using predictor.model."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def predict(self, batch):
+        return call_model_server(('predict_batch', self.name, batch), timeout=None)
+
+class RemotePredictor:
+    """BatchPredictor stand-in for web workers that forwards samples to the model server.
+
+    Each request thread keeps its own connection; the server batches the samples
+    of all workers through its BatchPredictors. A kept connection that the server
+    closed (e.g. it restarted) is replaced and the call retried once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.model = RemoteModel(name)
+        self.local = threading.local()
+
+    def predict(self, sample, timeout=MODEL_SERVER_TIMEOUT):
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            reused = connection is not None
+            if connection is None:
+                connection = Client(MODEL_SERVER_ADDRESS, family='AF_UNIX', authkey=MODEL_SERVER_AUTHKEY)
+                self.local.connection = connection
+            try:
+                return call_model_server(('predict', self.name, sample), connection, timeout)
+            except (OSError, EOFError, TimeoutError) as e:
+                # A broken or out-of-step connection is not reused
+                self.local.connection = None
+                connection.close()
+                if not (reused and attempt == 0 and isinstance(e, (EOFError, ConnectionError))):
+                    raise
+
+    def close(self):
+        pass
+
+# Per-user recommendation results. Entries are keyed on the user fields the results
+# depend on (purchase count, favorite team), so a purchase or team change made through
+# another worker or instance misses as soon as this process sees the new user document,
+# at most USER_CACHE_TTL later. Local writes also invalidate directly, and a generation
+# per user keeps a result computed before such a write from being stored after it.
+RECOMMENDATION_CACHE_TTL = int(os.getenv('RECOMMENDATION_CACHE_TTL', 300))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', 10000))
+recommendation_cache = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+recommendation_cache_generations = LRUCache(maxsize=RECOMMENDATION_CACHE_SIZE)
+recommendation_cache_counter = itertools.count(1)
+recommendation_cache_lock = threading.Lock()
+
+def recommendation_cache_key(current, kind, user_id, user_data):
+    return (user_id, kind, current['dataset_version'], current['model_version'], datetime.today().date(),
+            get_purchase_summary(user_data)['count'], user_data.get('favorite_team') or '')
+
+def recommendation_generation(user_id):
+    """Read before the user document; pass to cache_recommendations."""
+    with recommendation_cache_lock:
+        return recommendation_cache_generations.get(user_id)
+
+def get_cached_recommendations(current, kind, user_id, user_data):
+    with recommendation_cache_lock:
+        return recommendation_cache.get(recommendation_cache_key(current, kind, user_id, user_data))
+
+def cache_recommendations(current, kind, user_id, user_data, recommendations, generation):
+    """Store results unless invalidate_recommendations ran since the generation was read."""
+    with recommendation_cache_lock:
+        if recommendation_cache_generations.get(user_id) == generation:
+            recommendation_cache[recommendation_cache_key(current, kind, user_id, user_data)] = recommendations
+
+def invalidate_recommendations(user_id):
+    """Drop every cached recommendation list for a user after a write that affects them."""
+    with recommendation_cache_lock:
+        for key in [key for key in list(recommendation_cache.keys()) if key[0] == user_id]:
+            recommendation_cache.pop(key, None)
+        recommendation_cache_generations[user_id] = next(recommendation_cache_counter)
+
+# Recommendations materialized by precompute_recommendations.py, one document per
+# user in MATERIALIZED_COLLECTION. A document is used only while its fingerprint
+# (artifact versions, day and the user fields the models depend on) still matches.
+MATERIALIZED_COLLECTION = 'recommendations'
+
+def materialized_fingerprint(current, user_data, today):
+    return {
+        'dataset_version': current['dataset_version'],
+        'model_version': current['model_version'],
+        'date': today.isoformat(),
+        'purchase_count': get_purchase_summary(user_data)['count'],
+        'favorite_team': user_data.get('favorite_team') or ''
+    }
 
-if not USE_DUMMY:
+def get_materialized_recommendations(current, kind, user_id, user_data, today):
+    """Precomputed recommendations of the given kind, or None when missing or stale."""
     try:
-        model_history = tf.keras.models.load_model(HISTORY_MODEL_PATH)
-        model_coldstart = tf.keras.models.load_model(COLDSTART_MODEL_PATH)
+        doc = db.collection(MATERIALIZED_COLLECTION).document(user_id).get()
     except Exception as e:
-        print(f"Error loading models: {e}")
-        USE_DUMMY = True
-
-def get_user_data(user_id):
+        print(f"Materialized recommendation read error: {e}")
+        return None
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    fingerprint = materialized_fingerprint(current, user_data, today)
+    if any(data.get(key) != value for key, value in fingerprint.items()):
+        return None
+    return data.get(kind)
+
+def iter_document_pages(collection, page_size, start_after=None):
+    """Yield lists of up to page_size snapshots of a collection in document id order.
+
+    start_after is a snapshot or a {'__name__': document reference} cursor.
+    """
+    query = collection.order_by('__name__').limit(page_size)
+    last = start_after
+    while True:
+        page = list((query.start_after(last) if last else query).stream())
+        if not page:
+            return
+        yield page
+        last = page[-1]
+
+# Short-lived cache of users/{id} documents shared by all request threads
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+user_cache_lock = threading.Lock()
+# Bumped by invalidate_user, so a read that started before an invalidation
+# does not put the document it got back into the cache afterwards
+user_cache_generations = LRUCache(maxsize=USER_CACHE_SIZE)
+user_cache_counter = itertools.count(1)
+_MISSING = object()
+
+def read_user_doc(user_id):
+    """Read users/{user_id} straight from Firestore, bypassing every cache; None if missing."""
     doc = db.collection('users').document(user_id).get()
     return doc.to_dict() if doc.exists else None
 
+def get_user_data(user_id):
+    """Read users/{user_id} through a per-request memo and the process-wide user cache.
+
+    Returns a fresh deep copy (or None when the user does not exist) that callers may modify.
+    """
+    memo = g.setdefault('user_docs', {}) if has_request_context() else {}
+    user_data = memo.get(user_id, _MISSING)
+    if user_data is _MISSING:
+        with user_cache_lock:
+            user_data = user_cache.get(user_id, _MISSING)
+            generation = user_cache_generations.get(user_id)
+        if user_data is _MISSING:
+            user_data = read_user_doc(user_id)
+            with user_cache_lock:
+                if user_cache_generations.get(user_id) == generation:
+                    user_cache[user_id] = user_data
+        memo[user_id] = user_data
+    return copy.deepcopy(user_data)
+
+def invalidate_user(user_id):
+    """Forget the cached users/{user_id} document; call after every write to it."""
+    with user_cache_lock:
+        user_cache.pop(user_id, None)
+        user_cache_generations[user_id] = next(user_cache_counter)
+    if has_request_context():
+        g.setdefault('user_docs', {}).pop(user_id, None)
+
+# Email -> user id index: emails/{normalized email} documents {'user_id'}, created in
+# the same transaction as the user so registration is unique, plus an in-process
+# LRU of recent lookups. Mappings never change once written, only get deleted.
+# Users registered before the index existed are found with the old email query until
+# backfill_emails.py has written their mappings; only then set EMAIL_LEGACY_LOOKUP=0.
+# Registration always does the query, so uniqueness never depends on the backfill.
+EMAIL_CACHE_SIZE = int(os.getenv('EMAIL_CACHE_SIZE', 10000))
+EMAIL_LEGACY_LOOKUP = os.getenv('EMAIL_LEGACY_LOOKUP', '1').lower() in ('1', 'true', 'yes')
+email_cache = LRUCache(maxsize=EMAIL_CACHE_SIZE)
+email_cache_lock = threading.Lock()
+
+class EmailTaken(Exception):
+    """Raised when registering an email that already belongs to a user."""
+
+def normalize_email(email):
+    return str(email).strip().lower()
+
+def email_ref(email):
+    # Document ids cannot contain '/', which no deliverable address needs anyway
+    return db.collection('emails').document(normalize_email(email).replace('/', '%2F'))
+
+def lookup_user_id(email, legacy=None):
+    """Resolve an email to a user id through the LRU and the emails index.
+
+    With legacy (default EMAIL_LEGACY_LOOKUP), an email missing from the index is
+    looked up with the old email query, as given and lowercased, and its mapping
+    is written.
+    """
+    if legacy is None:
+        legacy = EMAIL_LEGACY_LOOKUP
+    key = normalize_email(email)
+    with email_cache_lock:
+        user_id = email_cache.get(key)
+    if user_id is not None:
+        return user_id
+
+    doc = email_ref(email).get()
+    if doc.exists:
+        user_id = doc.to_dict()['user_id']
+    elif not legacy:
+        return None
+    else:
+        users = []
+        for candidate in dict.fromkeys([str(email).strip(), key]):
+            users = list(db.collection('users').where('email', '==', candidate).limit(1).get())
+            if users:
+                break
+        if not users:
+            return None
+        user_id = users[0].id
+        try:
+            email_ref(email).create({'user_id': user_id, 'created_at': firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            print(f"Email index backfill skipped for {user_id}: {e}")
+
+    with email_cache_lock:
+        email_cache[key] = user_id
+    return user_id
+
+def find_user_by_email(email, fresh=False, legacy=None):
+    """Return (user_id, user_data) for an email, or (None, None) when no user has it.
+
+    fresh reads the user document from Firestore instead of the user cache, for
+    checks that must see the current password; legacy is passed to lookup_user_id.
+    """
+    read = read_user_doc if fresh else get_user_data
+    user_id = lookup_user_id(email, legacy)
+    user_data = read(user_id) if user_id else None
+    if user_id and user_data is None:
+        # The cached mapping belonged to an account deleted through another worker
+        with email_cache_lock:
+            email_cache.pop(normalize_email(email), None)
+        user_id = lookup_user_id(email, legacy)
+        user_data = read(user_id) if user_id else None
+    return (user_id, user_data) if user_data is not None else (None, None)
+
+def create_user_with_email(user_ref, user_data):
+    """Write a new user document and its email mapping atomically; raises EmailTaken."""
+    mapping_ref = email_ref(user_data['email'])
+
+    @firestore.transactional
+    def create(transaction):
+        mapping = mapping_ref.get(transaction=transaction)
+        # A mapping left behind by a deleted user does not block the email
+        if mapping.exists:
+            owner_ref = db.collection('users').document(mapping.to_dict()['user_id'])
+            if owner_ref.get(transaction=transaction).exists:
+                raise EmailTaken()
+        transaction.set(mapping_ref, {'user_id': user_ref.id, 'created_at': firestore.SERVER_TIMESTAMP})
+        transaction.set(user_ref, user_data)
+
+    create(db.transaction())
+    with email_cache_lock:
+        email_cache[normalize_email(user_data['email'])] = user_ref.id
+
+def release_email(email, user_id):
+    """Delete the mapping of a deleted user's email, if it still points at that user."""
+    mapping_ref = email_ref(email)
+    doc = mapping_ref.get()
+    if doc.exists and doc.to_dict().get('user_id') == user_id:
+        mapping_ref.delete()
+    with email_cache_lock:
+        email_cache.pop(normalize_email(email), None)
+
+# Purchases live in users/{user_id}/purchases, one document per purchase keyed by
+# its zero-padded sequence number; the user document only carries a small
+# purchase_summary ({'count', 'tickets', 'teams': {team: purchases}}) for the recommenders
+PURCHASE_FIELDS = [
+    'match_id', 'home_team', 'away_team', 'stadium',
+    'match_date', 'purchase_date', 'ticket_quantity'
+]
+PURCHASE_REQUIRED_FIELDS = ['match_id', 'ticket_quantity']
+PURCHASES_DEFAULT_LIMIT = 20
+PURCHASES_MAX_LIMIT = 100
+PURCHASE_WRITE_BATCH_SIZE = 400  # Firestore allows 500 writes per batch
+PURCHASE_MIGRATION_ATTEMPTS = 3
+
+def empty_purchase_summary():
+    return {'count': 0, 'tickets': 0, 'teams': {}}
+
+def add_to_purchase_summary(summary, purchase):
+    summary['count'] += 1
+    try:
+        summary['tickets'] += int(purchase.get('ticket_quantity') or 0)
+    except (TypeError, ValueError):
+        pass
+    for team in {str(purchase.get('home_team', '')).strip(), str(purchase.get('away_team', '')).strip()}:
+        if team:
+            summary['teams'][team] = summary['teams'].get(team, 0) + 1
+    return summary
+
+def get_purchase_summary(user_data):
+    """Purchase summary of a user document, derived from the legacy purchase_history
+    array for users that have not been migrated yet."""
+    summary = user_data.get('purchase_summary')
+    if summary is None:
+        summary = empty_purchase_summary()
+        for purchase in user_data.get('purchase_history') or []:
+            add_to_purchase_summary(summary, purchase)
+    return summary
+
+# Team affinity: per-user team weights (tickets bought, keyed by normalized team
+# name) decaying with AFFINITY_HALF_LIFE_DAYS. Stored on the user document as
+# team_affinity {'weights', 'updated_at'}, with weights valid as of updated_at
+AFFINITY_HALF_LIFE_DAYS = float(os.getenv('AFFINITY_HALF_LIFE_DAYS', 90))
+
+def decay_factor(elapsed_seconds):
+    return 0.5 ** (max(elapsed_seconds, 0) / (AFFINITY_HALF_LIFE_DAYS * 86400))
+
+def purchase_tickets(purchase):
+    try:
+        return max(int(purchase.get('ticket_quantity') or 1), 1)
+    except (TypeError, ValueError):
+        return 1
+
+def purchase_timestamp(purchase, default):
+    try:
+        return datetime.strptime(str(purchase.get('purchase_date'))[:10], '%Y-%m-%d').timestamp()
+    except ValueError:
+        return default
+
+def add_purchase_affinity(weights, purchase, factor=1.0):
+    tickets = purchase_tickets(purchase) * factor
+    for team in {normalize_name(purchase.get('home_team', '')), normalize_name(purchase.get('away_team', ''))}:
+        if team:
+            weights[team] = weights.get(team, 0.0) + tickets
+    return weights
+
+def build_team_affinity(purchases, now):
+    """Team weights for a list of purchases, each decayed by the age of its purchase_date."""
+    weights = {}
+    for purchase in purchases:
+        add_purchase_affinity(weights, purchase, decay_factor(now - purchase_timestamp(purchase, now)))
+    return weights
+
+def get_team_affinity(user_data, now=None):
+    """A user's team weights decayed to now.
+
+    Users without a stored profile fall back to their legacy purchase_history
+    array, or to the purchase counts of their summary.
+    """
+    now = time.time() if now is None else now
+    affinity = user_data.get('team_affinity')
+    if affinity:
+        factor = decay_factor(now - affinity['updated_at'])
+        return {team: weight * factor for team, weight in affinity['weights'].items()}
+    if user_data.get('purchase_history'):
+        return build_team_affinity(user_data['purchase_history'], now)
+    weights = {}
+    for team, count in get_purchase_summary(user_data)['teams'].items():
+        team = normalize_name(team)
+        weights[team] = weights.get(team, 0.0) + count
+    return weights
+
+def purchase_doc_id(seq):
+    return f"{seq:010d}"
+
+def purchase_document(purchase, seq):
+    return {
+        **{field: purchase.get(field) for field in PURCHASE_FIELDS},
+        'seq': seq,
+        'created_at': firestore.SERVER_TIMESTAMP
+    }
+
+class PurchaseHistoryPending(Exception):
+    """Raised by record_purchase while the user still has a legacy purchase_history array."""
+
+def migrate_purchase_history(user_id):
+    """Move a user's legacy purchase_history array into the purchases subcollection.
+
+    Purchase documents are written in batches under ids derived from their
+    position, so an interrupted or concurrent run rewrites the same documents;
+    the summary is then set and the array dropped in one transaction, only if
+    the array and summary are unchanged. An array that reappeared on a migrated
+    user (appended by an instance still running the old code) continues after
+    the purchases already in the subcollection. Returns the number of purchases
+    moved, 0 when there was nothing to move or another write got there first.
+    """
+    user_ref = db.collection('users').document(user_id)
+    snapshot = user_ref.get()
+    if not snapshot.exists:
+        return 0
+    data = snapshot.to_dict()
+    if 'purchase_history' not in data:
+        return 0
+
+    history = data.get('purchase_history') or []
+    base = data.get('purchase_summary')
+    first_seq = base['count'] if base else 0
+    purchases = user_ref.collection('purchases')
+    for start in range(0, len(history), PURCHASE_WRITE_BATCH_SIZE):
+        batch = db.batch()
+        for seq in range(start, min(start + PURCHASE_WRITE_BATCH_SIZE, len(history))):
+            batch.set(purchases.document(purchase_doc_id(first_seq + seq)),
+                      purchase_document(history[seq], first_seq + seq))
+        batch.commit()
+
+    @firestore.transactional
+    def finish(transaction):
+        current = user_ref.get(transaction=transaction).to_dict() or {}
+        if current.get('purchase_summary') != base or current.get('purchase_history') != history:
+            return False
+        now = time.time()
+        summary = copy.deepcopy(base) if base else empty_purchase_summary()
+        weights = {}
+        if base:
+            weights = get_team_affinity({key: value for key, value in current.items()
+                                         if key != 'purchase_history'}, now)
+        for purchase in history:
+            add_to_purchase_summary(summary, purchase)
+            add_purchase_affinity(weights, purchase, decay_factor(now - purchase_timestamp(purchase, now)))
+        transaction.update(user_ref, {
+            'purchase_summary': summary,
+            'team_affinity': {'weights': weights, 'updated_at': now},
+            'purchase_history': firestore.DELETE_FIELD
+        })
+        return True
+
+    migrated = finish(db.transaction())
+    invalidate_user(user_id)
+    return len(history) if migrated else 0
+
+def record_purchase(user_id, purchase):
+    """Append a purchase to the subcollection and fold it into the user's summary and
+    team affinity atomically.
+
+    Returns False when the user does not exist. Raises PurchaseHistoryPending while a
+    legacy purchase_history array is present: its purchases take the next sequence
+    numbers, so recording first would overwrite them.
+    """
+    user_ref = db.collection('users').document(user_id)
+
+    @firestore.transactional
+    def record(transaction):
+        snapshot = user_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return False
+        data = snapshot.to_dict()
+        if 'purchase_history' in data:
+            raise PurchaseHistoryPending()
+        summary = data.get('purchase_summary') or empty_purchase_summary()
+        seq = summary['count']
+        now = time.time()
+        weights = add_purchase_affinity(get_team_affinity(data, now), purchase)
+        transaction.set(
+            user_ref.collection('purchases').document(purchase_doc_id(seq)),
+            purchase_document(purchase, seq)
+        )
+        transaction.update(user_ref, {
+            'purchase_summary': add_to_purchase_summary(summary, purchase),
+            'team_affinity': {'weights': weights, 'updated_at': now}
+        })
+        return True
+
+    recorded = record(db.transaction())
+    invalidate_user(user_id)
+    return recorded
+
+def list_purchases(user_id, args, total):
+    """Read one page of a user's purchases in purchase order.
+
+    Raises ValueError with a client-facing message for invalid parameters.
+    """
+    try:
+        limit = int(args.get('limit', PURCHASES_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= PURCHASES_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {PURCHASES_MAX_LIMIT}')
+
+    try:
+        after = decode_cursor(args['cursor']) if args.get('cursor') else -1
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+    # One extra document tells whether another page follows
+    docs = list(
+        db.collection('users').document(user_id).collection('purchases')
+        .where('seq', '>', after)
+        .order_by('seq')
+        .limit(limit + 1)
+        .stream()
+    )
+    page = [doc.to_dict() for doc in docs[:limit]]
+    next_cursor = encode_cursor(page[-1]['seq']) if len(docs) > limit else None
+
+    return {
+        'data': [{field: purchase.get(field) for field in PURCHASE_FIELDS} for purchase in page],
+        'pagination': {
+            'limit': limit,
+            'total': total,
+            'next_cursor': next_cursor
+        }
+    }
+
+def delete_purchases(user_id):
+    purchases = db.collection('users').document(user_id).collection('purchases')
+    while True:
+        docs = list(purchases.limit(PURCHASE_WRITE_BATCH_SIZE).stream())
+        if not docs:
+            return
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+
+# Tokens older than this are rejected, so older revocations no longer matter
+TOKEN_MAX_AGE = int(os.getenv('TOKEN_MAX_AGE_DAYS', 30)) * 86400
+TOKEN_REVOCATION_RETRY_MAX = 60
+TOKEN_REVOCATION_PRUNE_INTERVAL = 3600
+
+# Per-user "tokens issued before this epoch are revoked", mirrored from the
+# token_revocations collection by a snapshot listener so verify_token does not read
+# Firestore. Until the listener has applied its first snapshot, and while it is down,
+# verify_token reads the user's revocation document instead.
+token_valid_after = {}
+token_revocation_status = {'listener': 'starting', 'error': None}
+token_revocations_synced = threading.Event()
+
+def apply_token_revocations(snapshots, changes, read_time):
+    cutoff = time.time() - TOKEN_MAX_AGE
+    for change in changes:
+        valid_after = (change.document.to_dict() or {}).get('valid_after', 0)
+        if change.type.name == 'REMOVED' or valid_after < cutoff:
+            token_valid_after.pop(change.document.id, None)
+        else:
+            token_valid_after[change.document.id] = valid_after
+    # The first snapshot holds every revocation; only now is the mirror complete
+    if not token_revocations_synced.is_set():
+        token_revocation_status.update(listener='listening', error=None)
+        token_revocations_synced.set()
+
+def prune_token_revocations():
+    """Drop revocations older than TOKEN_MAX_AGE, in memory and in Firestore."""
+    cutoff = time.time() - TOKEN_MAX_AGE
+    for user_id, valid_after in list(token_valid_after.items()):
+        if valid_after < cutoff:
+            token_valid_after.pop(user_id, None)
+    docs = list(db.collection('token_revocations').where('valid_after', '<', cutoff).limit(400).stream())
+    if docs:
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+
+def watch_token_revocations():
+    """Keep the revocation listener running, restarting it with backoff when it fails."""
+    watch, delay, pruned_at = None, 1, 0
+    while True:
+        try:
+            if watch is None or not getattr(watch, 'is_active', True):
+                token_revocations_synced.clear()
+                if watch is not None:
+                    print("Token revocation listener stopped, restarting")
+                    token_revocation_status['listener'] = 'restarting'
+                watch = db.collection('token_revocations').on_snapshot(apply_token_revocations)
+                delay = 1
+            if time.time() - pruned_at > TOKEN_REVOCATION_PRUNE_INTERVAL:
+                prune_token_revocations()
+                pruned_at = time.time()
+        except Exception as e:
+            print(f"Token revocation listener error: {e}, retrying in {delay}s")
+            if watch is None or not getattr(watch, 'is_active', True):
+                watch = None
+                token_revocations_synced.clear()
+                token_revocation_status.update(listener='failed', error=str(e))
+            time.sleep(delay)
+            delay = min(delay * 2, TOKEN_REVOCATION_RETRY_MAX)
+            continue
+        time.sleep(delay)
+
+def token_revoked_at(user_id):
+    """valid_after of the user's revocation, read from Firestore until the listener is in sync."""
+    if token_revocations_synced.is_set():
+        return token_valid_after.get(user_id, 0)
+    doc = db.collection('token_revocations').document(user_id).get()
+    return (doc.to_dict() or {}).get('valid_after', 0) if doc.exists else 0
+
+if APP_ROLE == 'web':
+    threading.Thread(target=watch_token_revocations, daemon=True).start()
+else:
+    token_revocation_status['listener'] = 'disabled'
+
+def revoke_tokens(user_id):
+    """Revoke every token issued to the user up to now."""
+    valid_after = time.time()
+    db.collection('token_revocations').document(user_id).set({
+        'valid_after': valid_after,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    token_valid_after[user_id] = valid_after
+
 def generate_token(user_id):
     try:
         payload = {
-            'iat': datetime.utcnow(),
+            # Sub-second iat so a login right after a logout is not caught by the revocation
+            'iat': time.time(),
+            'jti': uuid.uuid4().hex,
             'sub': user_id,
             'type': 'persistent'
         }
@@ -186,9 +1216,16 @@ def verify_token(f):
                                algorithms=['HS256'], options={"verify_exp": False})
             request.user_id = payload['sub']
             
-            user_data = get_user_data(payload['sub'])
-            if user_data and user_data.get('token_invalidated_at'):
-                return jsonify({'status': False, 'message': 'Token has been invalidated'}), 401
+            if 'jti' in payload:
+                if payload.get('iat', 0) < time.time() - TOKEN_MAX_AGE:
+                    return jsonify({'status': False, 'message': 'Token has expired'}), 401
+                if payload.get('iat', 0) < token_revoked_at(payload['sub']):
+                    return jsonify({'status': False, 'message': 'Token has been invalidated'}), 401
+            else:
+                # Tokens issued before revocation epochs existed still use the user document flag
+                user_data = get_user_data(payload['sub'])
+                if user_data and user_data.get('token_invalidated_at'):
+                    return jsonify({'status': False, 'message': 'Token has been invalidated'}), 401
                 
         except jwt.InvalidTokenError:
             return jsonify({'status': False, 'message': 'Invalid token'}), 401
@@ -196,90 +1233,808 @@ def verify_token(f):
         return f(*args, **kwargs)
     return decorated
 
-def format_alldata(match):
-    return {
-        "id_match": match['ID Match'],
-        "match": match['Match'],
-        "home_score": int(match['Score tim home']) if not pd.isna(match['Score tim home']) else 0,
-        "away_score": int(match['Score tim away']) if not pd.isna(match['Score tim away']) else 0,
-        "home_team": match['Home'].strip(),
-        "away_team": match['Away'].strip(),
-        "lokasi": match['Lokasi'],
-        "jam": match['Jam'].rsplit(':', 1)[0],
-        "waktu": match['Waktu'],
-        "stadion": match['Stadion'],
-        "hari": match['Hari'],
-        "tanggal": match['Tanggal'],
-        "tiket_terjual": int(match['Jumlah Tiket Terjual']),
+# Response field -> normalized dataset column
+ALLDATA_FIELDS = {
+    "id_match": 'ID Match',
+    "match": 'Match',
+    "home_score": 'Score tim home',
+    "away_score": 'Score tim away',
+    "home_team": 'Home',
+    "away_team": 'Away',
+    "lokasi": 'Lokasi',
+    "jam": 'Jam',
+    "waktu": 'Waktu',
+    "stadion": 'Stadion',
+    "hari": 'Hari',
+    "tanggal": 'Tanggal',
+    "tiket_terjual": 'Jumlah Tiket Terjual',
+}
+
+def format_records(df, fields):
+    frame = df[list(fields.values())].astype(object)
+    frame.columns = list(fields)
+    return frame.to_dict('records')
+
+def format_alldata(df):
+    return format_records(df, ALLDATA_FIELDS)
+
+def format_match_recommendation(df, action="Consider buying tickets"):
+    return format_records(df.assign(action=action), {**ALLDATA_FIELDS, "suggested_action": 'action'})
+
+def normalize_name(name):
+    return str(name).strip().lower()
+
+def group_rows(values):
+    """Map each normalized value of a column to its row positions, in dataset order."""
+    codes, uniques = pd.factorize(values.astype(str).str.lower())
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques)}
+
+def build_match_index(df):
+    """Build lookup structures for the recommendation endpoints once per dataset load.
+
+    teams maps a normalized team name to its row positions, both in dataset
+    order ('rows') and sorted by match date ('positions', with the matching
+    'dates') so upcoming matches can be found with a binary search. incidence
+    is the team-by-match 0/1 matrix (rows ordered as team_ids) used to score
+    matches against a user's team affinity. by_id maps each ID Match to its
+    row, the first one if an id repeats.
+    """
+    index = {
+        'records': [],
+        'by_id': {},
+        'dates': np.array([], dtype='datetime64[D]'),
+        'by_date': np.array([], dtype=int),
+        'teams': {},
+        'stadiums': {},
+        'locations': {},
+        'team_ids': {},
+        'incidence': np.zeros((0, 0), dtype=np.float32)
     }
+    if df.empty:
+        return index
+
+    index['records'] = format_match_recommendation(df)
+    index['dates'] = dates = df['Tanggal Parsed'].to_numpy(dtype='datetime64[D]')
+    ids = df['ID Match'].to_numpy().tolist()
+    index['by_id'] = dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+
+    home = df['Home'].astype(str).str.lower().to_numpy()
+    away = df['Away'].astype(str).str.lower().to_numpy()
+    by_date = np.argsort(dates, kind='stable')
+    index['by_date'] = by_date = by_date[~np.isnat(dates[by_date])]
+    index['stadiums'] = group_rows(df['Stadion'])
+    index['locations'] = group_rows(df['Lokasi'])
+
+    teams = np.union1d(home, away)
+    index['team_ids'] = {team: i for i, team in enumerate(teams)}
+    incidence = np.zeros((len(teams), len(df)), dtype=np.float32)
+    columns = np.arange(len(df))
+    incidence[np.searchsorted(teams, home), columns] = 1
+    incidence[np.searchsorted(teams, away), columns] = 1
+    index['incidence'] = incidence
+
+    for team in teams:
+        rows = np.flatnonzero((home == team) | (away == team))
+        positions = by_date[(home[by_date] == team) | (away[by_date] == team)]
+        index['teams'][team] = {
+            'rows': rows,
+            'positions': positions,
+            'dates': dates[positions]
+        }
+    return index
+
+def team_rows(index, teams):
+    """Row positions (dataset order) of every match involving any of the given teams."""
+    entries = [index['teams'].get(normalize_name(team)) for team in teams]
+    rows = [entry['rows'] for entry in entries if entry is not None]
+    return np.unique(np.concatenate(rows)) if rows else np.array([], dtype=int)
+
+def upcoming_rows(index, teams, today):
+    """Row positions (dataset order) of matches on or after today involving any of the given teams."""
+    today = np.datetime64(today, 'D')
+    rows = []
+    for team in teams:
+        entry = index['teams'].get(normalize_name(team))
+        if entry is None:
+            continue
+        start = np.searchsorted(entry['dates'], today, side='left')
+        rows.append(entry['positions'][start:])
+    return np.unique(np.concatenate(rows)) if rows else np.array([], dtype=int)
+
+def affinity_rows(index, weights, today=None, k=10):
+    """Row positions of matches ranked by team affinity, best first.
+
+    A match scores the summed weight of its two teams: one product of the weight
+    vector with the incidence matrix. Ties go to the earlier match; matches of
+    teams without weight are dropped, and so are past ones when today is given.
+    """
+    vector = np.zeros(len(index['team_ids']), dtype=np.float32)
+    for team, weight in weights.items():
+        position = index['team_ids'].get(normalize_name(team))
+        if position is not None:
+            vector[position] = weight
+    scores = vector @ index['incidence']
+
+    candidates = np.flatnonzero(scores > 0)
+    if today is not None:
+        candidates = candidates[index['dates'][candidates] >= np.datetime64(today, 'D')]
+    order = np.lexsort((candidates, index['dates'][candidates], -scores[candidates]))
+    ranked = candidates[order]
+    return ranked if k is None else ranked[:k]
+
+def date_range_rows(index, date_from=None, date_to=None):
+    """Row positions (dataset order) of matches dated within [date_from, date_to]."""
+    dates = index['dates'][index['by_date']]
+    start = 0 if date_from is None else np.searchsorted(dates, np.datetime64(date_from, 'D'), side='left')
+    end = len(dates) if date_to is None else np.searchsorted(dates, np.datetime64(date_to, 'D'), side='right')
+    return np.sort(index['by_date'][start:end])
+
+def match_records(index, rows, action=None):
+    records = index['records']
+    if action is None:
+        return [records[row] for row in rows]
+    return [{**records[row], 'suggested_action': action} for row in rows]
+
+def match_row(index, match_id):
+    """Row of the match with this ID Match, or None; raises ValueError for non-integer ids."""
+    return index['by_id'].get(int(str(match_id).strip()))
+
+def build_purchase(index, data, today):
+    """A purchase with its match fields taken from the dataset rather than the client.
+
+    Raises ValueError with a client-facing message for invalid input.
+    """
+    try:
+        row = match_row(index, data['match_id'])
+    except ValueError:
+        raise ValueError('match_id must be an integer')
+    if row is None:
+        raise ValueError(f"Unknown match_id: {data['match_id']}")
+
+    # A JSON integer only: int() would also accept "3", 2.9 (truncated) and true
+    ticket_quantity = data['ticket_quantity']
+    if not isinstance(ticket_quantity, int) or isinstance(ticket_quantity, bool) or ticket_quantity < 1:
+        raise ValueError('ticket_quantity must be a positive integer')
+
+    purchase_date = data.get('purchase_date') or today.isoformat()
+    try:
+        parse_query_date(str(purchase_date))
+    except ValueError:
+        raise ValueError('purchase_date must use the YYYY-MM-DD format')
 
-def format_match_recommendation(match, action="Consider buying tickets"):
+    record = index['records'][row]
+    match_date = index['dates'][row]
     return {
-        "id_match": match['ID Match'],
-        "match": match['Match'],
-        "home_score": int(match['Score tim home']) if not pd.isna(match['Score tim home']) else 0,
-        "away_score": int(match['Score tim away']) if not pd.isna(match['Score tim away']) else 0,
-        "home_team": match['Home'].strip(),
-        "away_team": match['Away'].strip(),
-        "lokasi": match['Lokasi'],
-        "jam": match['Jam'].rsplit(':', 1)[0],
-        "waktu": match['Waktu'],
-        "stadion": match['Stadion'],
-        "hari": match['Hari'],
-        "tanggal": match['Tanggal'],
-        "tiket_terjual": int(match['Jumlah Tiket Terjual']),
-        "suggested_action": action
+        'match_id': record['id_match'],
+        'home_team': record['home_team'],
+        'away_team': record['away_team'],
+        'stadium': record['stadion'],
+        'match_date': record['tanggal'] if np.isnat(match_date) else str(match_date),
+        'purchase_date': str(purchase_date),
+        'ticket_quantity': ticket_quantity
     }
 
 def get_recommendations_history(user_id):
     user_data = get_user_data(user_id)
-    if not user_data or not user_data.get('purchase_history'):
+    if not user_data:
+        return []
+    if not get_purchase_summary(user_data)['count']:
         return []
 
-    relevant_teams = {team.strip() for purchase in user_data['purchase_history']
-                     for team in [purchase['home_team'], purchase['away_team']]}
-
-    if USE_DUMMY:
-        recommendations = [
-            format_match_recommendation(match)
-            for _, match in dataset.iterrows()
-            if match['Home'].strip() in relevant_teams or match['Away'].strip() in relevant_teams
-        ]
-        return recommendations
+    current = artifacts
+    if current['use_dummy']:
+        index = current['match_index']
+        return match_records(index, affinity_rows(index, get_team_affinity(user_data), k=None))
     
-    return process_predictions(model_history.predict(user_data))
+    return process_predictions(current['match_index'], current['history_predictor'].predict(user_id))
 
 def get_recommendations_new_user(favorite_team):
-    if USE_DUMMY:
-        recommendations = [
-            format_match_recommendation(match, "New match for you!")
-            for _, match in dataset.iterrows()
-            if favorite_team in [match['Home'].strip(), match['Away'].strip()]
-        ]
-        return recommendations[:10]
+    current = artifacts
+    if current['use_dummy']:
+        # Teams are matched ignoring case and surrounding spaces, like the history path
+        rows = team_rows(current['match_index'], [favorite_team])[:10]
+        return match_records(current['match_index'], rows, "New match for you!")
     
-    return process_predictions(model_coldstart.predict([favorite_team]))
+    return process_predictions(current['match_index'], current['coldstart_predictor'].predict([favorite_team]))
+
+def build_alldata_response(df):
+    """Serialize /api/alldata once per dataset load."""
+    if df.empty:
+        return None
+
+    return build_cached_response({
+        "status": True,
+        "message": "All data retrieved successfully",
+        "data": format_alldata(df)
+    })
+
+def build_cached_response(payload):
+    """Serialize a JSON payload once, with a strong ETag and compressed variants (see send_cached_response)."""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body)
+
+    return {
+        'etag': etag,
+        'variants': variants,
+        'etags': {encoding: etag if encoding == 'identity' else f"{etag}-{encoding}"
+                  for encoding in variants}
+    }
+
+ALLDATA_DEFAULT_LIMIT = 100
+ALLDATA_MAX_LIMIT = 500
+ALLDATA_QUERY_PARAMS = {'limit', 'cursor', 'fields', 'team', 'stadium', 'lokasi', 'date_from', 'date_to'}
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(str(int(row)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode()).decode())
+
+def parse_query_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def query_alldata(index, args):
+    """Answer a filtered, paginated /api/alldata request from the match index.
+
+    Raises ValueError with a client-facing message for invalid parameters.
+    """
+    try:
+        limit = int(args.get('limit', ALLDATA_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= ALLDATA_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {ALLDATA_MAX_LIMIT}')
+
+    fields = list(ALLDATA_FIELDS)
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in ALLDATA_FIELDS]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+
+    try:
+        date_from = parse_query_date(args['date_from']) if args.get('date_from') else None
+        date_to = parse_query_date(args['date_to']) if args.get('date_to') else None
+    except ValueError:
+        raise ValueError('date_from and date_to must use the YYYY-MM-DD format')
 
-def process_predictions(predictions):
     try:
-        if dataset.empty:
+        after = decode_cursor(args['cursor']) if args.get('cursor') else 0
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+    # Each filter resolves to sorted row positions; combining them is a set intersection
+    selections = []
+    if args.get('team'):
+        selections.append(team_rows(index, [args['team']]))
+    if args.get('stadium'):
+        selections.append(index['stadiums'].get(normalize_name(args['stadium']), np.array([], dtype=int)))
+    if args.get('lokasi'):
+        selections.append(index['locations'].get(normalize_name(args['lokasi']), np.array([], dtype=int)))
+    if date_from or date_to:
+        selections.append(date_range_rows(index, date_from, date_to))
+
+    if selections:
+        # Start from the narrowest filter so the work follows the matching rows, not the season
+        selections.sort(key=len)
+        rows = selections[0]
+        for selection in selections[1:]:
+            if not len(rows):
+                break
+            # Binary search in the (sorted, no smaller) next selection: O(len(rows) * log(len(selection)))
+            found = np.searchsorted(selection, rows).clip(max=len(selection) - 1)
+            rows = rows[selection[found] == rows]
+    else:
+        rows = np.arange(len(index['records']))
+
+    start = np.searchsorted(rows, after, side='left')
+    page = rows[start:start + limit]
+    next_cursor = encode_cursor(rows[start + limit]) if start + limit < len(rows) else None
+
+    records = index['records']
+    return {
+        'data': [{field: records[row][field] for field in fields} for row in page],
+        'pagination': {
+            'limit': limit,
+            'total': int(len(rows)),
+            'next_cursor': next_cursor
+        }
+    }
+
+def send_cached_response(cached):
+    encoding = request.accept_encodings.best_match(
+        [encoding for encoding in ('br', 'gzip') if encoding in cached['variants']],
+        default='identity'
+    )
+    etag = cached['etags'][encoding]
+
+    # Every variant carries the same dataset version, so any of them validates
+    if any(request.if_none_match.contains_weak(tag) for tag in cached['etags'].values()):
+        response = Response(status=304)
+    else:
+        response = Response(cached['variants'][encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Ticket-sales analytics, aggregated once per dataset load
+ANALYTICS_TOP_FIXTURES_DEFAULT = 10
+ANALYTICS_TOP_FIXTURES_MAX = 100
+
+def ticket_totals(keys, labels, tickets, label_field):
+    """Sum tickets per normalized key, best-selling first.
+
+    Returns {key: {label_field: label, 'matches', 'tiket_terjual',
+    'average_tiket_terjual'}}; the label is the key's first spelling in the data.
+    """
+    frame = pd.DataFrame({'key': keys, 'label': labels, 'tickets': tickets})
+    grouped = frame.groupby('key', sort=False).agg(
+        label=('label', 'first'), matches=('tickets', 'size'), tickets=('tickets', 'sum'))
+    grouped = grouped.sort_values('tickets', ascending=False, kind='stable')
+    return {
+        key: {
+            label_field: label,
+            'matches': int(matches),
+            'tiket_terjual': int(total),
+            'average_tiket_terjual': round(total / matches, 1)
+        }
+        for key, label, matches, total in zip(grouped.index, grouped['label'], grouped['matches'], grouped['tickets'])
+    }
+
+def build_ticket_analytics(df):
+    """Aggregate tickets sold per team, stadium and month for the analytics endpoints.
+
+    A match counts for both its teams, and again as a home match for the home
+    team. Requests then only look entries up; the full lists are serialized
+    here like /api/alldata.
+    """
+    if df.empty:
+        return None
+
+    tickets = df['Jumlah Tiket Terjual'].to_numpy()
+    home = df['Home'].astype(str)
+    both = pd.concat([home, df['Away'].astype(str)], ignore_index=True)
+    teams = ticket_totals(both.str.lower().to_numpy(), both.to_numpy(), np.concatenate([tickets, tickets]), 'team')
+    for key, entry in ticket_totals(home.str.lower().to_numpy(), home.to_numpy(), tickets, 'team').items():
+        teams[key]['home_matches'] = entry['matches']
+        teams[key]['home_tiket_terjual'] = entry['tiket_terjual']
+    for entry in teams.values():
+        entry.setdefault('home_matches', 0)
+        entry.setdefault('home_tiket_terjual', 0)
+
+    stadion = df['Stadion'].astype(str)
+    stadiums = ticket_totals(stadion.str.lower().to_numpy(), stadion.to_numpy(), tickets, 'stadion')
+    lokasi = df['Lokasi'].astype(str).groupby(stadion.str.lower().to_numpy(), sort=False).first()
+    for key, entry in stadiums.items():
+        entry['lokasi'] = lokasi[key]
+
+    # Undated matches are left out of the monthly totals only
+    dates = df['Tanggal Parsed'].to_numpy(dtype='datetime64[D]')
+    dated = ~np.isnat(dates)
+    month_keys = dates[dated].astype('datetime64[M]').astype(str)
+    months = ticket_totals(month_keys, month_keys, tickets[dated], 'month')
+    months = {key: months[key] for key in sorted(months)}
+
+    def list_response(label, entries):
+        return build_cached_response({
+            'status': True,
+            'message': f'Ticket sales per {label} retrieved successfully',
+            'data': list(entries)
+        })
+
+    return {
+        'team': teams,
+        'stadium': stadiums,
+        'month': months,
+        # Row positions by tickets sold, most first; top-N is a slice
+        'fixture_order': np.argsort(-tickets, kind='stable'),
+        'responses': {
+            'team': list_response('team', teams.values()),
+            'stadium': list_response('stadium', stadiums.values()),
+            'month': list_response('month', months.values())
+        }
+    }
+
+# Versioned artifact registry. Everything derived from the dataset and models lives
+# in one snapshot dict that is replaced as a whole; handlers read `artifacts` once
+# and keep using that snapshot, so a reload never mixes versions mid-request.
+ARTIFACT_POLL_INTERVAL = int(os.getenv('ARTIFACT_POLL_INTERVAL', 300))
+PREDICTOR_RETIRE_SECONDS = 60
+bootstrap_status = {'dataset': 'pending', 'models': 'pending'}
+dataset_ready = threading.Event()
+models_ready = threading.Event()
+artifacts_reload_lock = threading.Lock()
+
+DUMMY_MODEL_ARTIFACTS = {
+    'use_dummy': True,
+    'history_predictor': None,
+    'coldstart_predictor': None,
+    'model_version': 'dummy',
+    'model_backend': None,
+    'model_generations': None
+}
+# (backend, generations) of model files that failed to load, so they are not retried every poll
+rejected_models = set()
+rejected_datasets = set()
+
+# Artifacts derived from the dataset; the model server pickles them next to the
+# shared columns (DERIVED_ARTIFACTS_FILE) so web workers do not rebuild them
+DERIVED_ARTIFACT_KEYS = ('match_index', 'alldata_response', 'ticket_analytics')
+DERIVED_ARTIFACTS_FILE = 'derived.pickle'
+shared_dataset = {'version': None}
+
+def dataset_artifacts(loaded, version, dataset_format, generation, derived=None):
+    if derived is None:
+        derived = {
+            'match_index': build_match_index(loaded),
+            'alldata_response': build_alldata_response(loaded),
+            'ticket_analytics': build_ticket_analytics(loaded)
+        }
+    return {
+        'dataset': loaded,
+        **{key: derived[key] for key in DERIVED_ARTIFACT_KEYS},
+        'dataset_version': version,
+        'dataset_format': dataset_format,
+        'dataset_generation': generation
+    }
+
+def columns_match_csv(path):
+    """Whether the column archive at path was built from the dataset.csv now in the bucket."""
+    try:
+        blob = bucket.get_blob(DATASET_BLOB_PATH)
+        if blob is None or not blob.md5_hash:
+            return True
+        return columnar.archive_version(path) == base64.b64decode(blob.md5_hash).hex()
+    except Exception as e:
+        print(f"Error checking dataset columns: {e}")
+        return False
+
+def download_dataset(current):
+    """Download the prebuilt column archive, or the CSV when there is no usable one.
+
+    Returns (format, generation) like download_models. An archive built from
+    an older dataset.csv is skipped until build_dataset.py is run again.
+    """
+    for dataset_format, (blob_path, local_path) in DATASET_SOURCES.items():
+        known = current['dataset_generation'] if current['dataset_format'] == dataset_format else None
+        generation = download_from_gcs(blob_path, local_path, known)
+        if generation is None or (dataset_format, generation) in rejected_datasets:
+            continue
+        if dataset_format == 'columns' and not columns_match_csv(local_path):
+            print(f"{DATASET_COLUMNS_BLOB_PATH} does not match {DATASET_BLOB_PATH}, using the csv")
+            continue
+        return dataset_format, generation
+    return dataset_format, generation
+
+def build_dataset_artifacts(dataset_format, generation):
+    _, local_path = DATASET_SOURCES[dataset_format]
+    if not os.path.exists(local_path):
+        raise FileNotFoundError(local_path)
+    try:
+        if dataset_format == 'csv':
+            loaded = normalize_dataset(pd.read_csv(DATASET_PATH))
+            return dataset_artifacts(loaded, file_md5(DATASET_PATH), dataset_format, generation)
+        # Memory-mapped, so processes on this machine share the pages
+        directory = columnar.extract_archive(local_path, SHARED_DATASET_DIR)
+        loaded = columnar.read_dataset(directory)
+    except Exception:
+        # Not retried until the bucket has a new generation
+        rejected_datasets.add((dataset_format, generation))
+        raise
+    # The version is the source CSV's md5, the same as when parsing the CSV
+    return dataset_artifacts(loaded, os.path.basename(directory), dataset_format, generation)
+
+def share_dataset(current):
+    """Make sure the snapshot's dataset has column files under SHARED_DATASET_DIR (the
+    model server writes them for the web workers) and drop the directories of older
+    versions; returns the directory.
+
+    The model server also writes its derived artifacts there, once per version and
+    process so a file left by an earlier run is never trusted.
+    """
+    directory = os.path.join(SHARED_DATASET_DIR, current['dataset_version'])
+    columnar.write_dataset(current['dataset'], directory)
+    if APP_ROLE == 'model-server' and shared_dataset['version'] != current['dataset_version']:
+        path = os.path.join(directory, DERIVED_ARTIFACTS_FILE)
+        with open(f"{path}.part-{os.getpid()}", 'wb') as f:
+            pickle.dump({key: current[key] for key in DERIVED_ARTIFACT_KEYS}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.part-{os.getpid()}", path)
+        shared_dataset['version'] = current['dataset_version']
+    # Workers that still map an old version keep their pages after the unlink
+    for name in os.listdir(SHARED_DATASET_DIR):
+        if name != current['dataset_version']:
+            shutil.rmtree(os.path.join(SHARED_DATASET_DIR, name), ignore_errors=True)
+    return directory
+
+def download_models(current):
+    """Download the model files of the first usable backend, INFERENCE_BACKEND before keras.
+
+    Returns (backend, generations); a backend is skipped when its files are
+    missing from the bucket or are the ones that already failed to load.
+    """
+    backends = [INFERENCE_BACKEND] + (['keras'] if INFERENCE_BACKEND != 'keras' else [])
+    for backend in backends:
+        known = current['model_generations'] if current['model_backend'] == backend else None
+        known = known or (None,) * len(MODEL_NAMES)
+        with ThreadPoolExecutor(max_workers=len(MODEL_NAMES)) as pool:
+            downloads = [pool.submit(download_from_gcs, blob_path, local_path, generation)
+                         for (blob_path, local_path), generation in zip(model_paths(backend), known)]
+            generations = tuple(download.result() for download in downloads)
+        if None not in generations and (backend, generations) not in rejected_models:
+            return backend, generations
+    return backend, generations
+
+def build_model_artifacts(backend, generations):
+    paths = [local_path for _, local_path in model_paths(backend)]
+    if not all(os.path.exists(path) for path in paths):
+        raise FileNotFoundError('Model files are not available')
+    try:
+        # TensorFlow or the TFLite interpreter is only imported once the models are actually needed
+        model_history, model_coldstart = [load_model(path, backend) for path in paths]
+    except Exception:
+        rejected_models.add((backend, generations))
+        raise
+    return {
+        'use_dummy': False,
+        'history_predictor': BatchPredictor(model_history),
+        'coldstart_predictor': BatchPredictor(model_coldstart),
+        'model_version': '-'.join(file_md5(path)[:12] for path in paths),
+        'model_backend': backend,
+        'model_generations': generations
+    }
+
+# Empty snapshot until the first reload_artifacts() completes
+artifacts = {
+    'dataset': pd.DataFrame(),
+    'match_index': build_match_index(pd.DataFrame()),
+    'alldata_response': None,
+    'ticket_analytics': None,
+    'dataset_version': None,
+    'dataset_format': None,
+    'dataset_generation': None,
+    **DUMMY_MODEL_ARTIFACTS,
+    'model_version': None
+}
+
+def retire_predictors(old, new):
+    # In-flight requests may still hold the old snapshot, so give them time to finish
+    for name in ['history_predictor', 'coldstart_predictor']:
+        if old[name] is not None and old[name] is not new[name]:
+            threading.Timer(PREDICTOR_RETIRE_SECONDS, old[name].close).start()
+
+def reload_artifacts():
+    """Fetch artifacts whose bucket generation changed, build them aside and swap them in."""
+    global artifacts
+    with artifacts_reload_lock:
+        current = artifacts
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            dataset_download = pool.submit(download_dataset, current)
+            model_download = pool.submit(download_models, current)
+            dataset_format, dataset_generation = dataset_download.result()
+            model_backend, model_generations = model_download.result()
+
+        # After the first attempt a version is only loaded if it is new and has not failed before
+        updates = {}
+        dataset_key = (dataset_format, dataset_generation)
+        if bootstrap_status['dataset'] == 'pending' or (
+                dataset_generation is not None and dataset_key not in rejected_datasets
+                and dataset_key != (current['dataset_format'], current['dataset_generation'])):
+            try:
+                if bootstrap_status['dataset'] != 'ready':
+                    bootstrap_status['dataset'] = 'loading'
+                try:
+                    updates.update(build_dataset_artifacts(dataset_format, dataset_generation))
+                except Exception as e:
+                    if dataset_format == 'csv':
+                        raise
+                    print(f"Error loading dataset columns, falling back to csv: {e}")
+                    dataset_format, dataset_generation = download_dataset(current)
+                    updates.update(build_dataset_artifacts(dataset_format, dataset_generation))
+                bootstrap_status['dataset'] = 'ready'
+            except Exception as e:
+                print(f"Error loading dataset: {e}")
+                if bootstrap_status['dataset'] != 'ready':
+                    bootstrap_status['dataset'] = 'failed'
+
+        model_key = (model_backend, model_generations)
+        if bootstrap_status['models'] == 'pending' or (
+                None not in model_generations and model_key not in rejected_models
+                and model_key != (current['model_backend'], current['model_generations'])):
+            try:
+                if bootstrap_status['models'] != 'ready':
+                    bootstrap_status['models'] = 'loading'
+                try:
+                    updates.update(build_model_artifacts(model_backend, model_generations))
+                except Exception as e:
+                    if model_backend == 'keras':
+                        raise
+                    # Converted files that do not load (e.g. ops missing from the interpreter)
+                    print(f"Error loading {model_backend} models, falling back to keras: {e}")
+                    model_backend, model_generations = download_models(current)
+                    updates.update(build_model_artifacts(model_backend, model_generations))
+                bootstrap_status['models'] = 'ready'
+            except Exception as e:
+                print(f"Error loading models: {e}")
+                if bootstrap_status['models'] != 'ready':
+                    bootstrap_status['models'] = 'failed'
+                    if current['model_version'] != 'dummy':
+                        updates.update(DUMMY_MODEL_ARTIFACTS)
+
+        if updates:
+            artifacts = {**current, **updates}
+            # Anything derived from the previous snapshot is stale now
+            with recommendation_cache_lock:
+                recommendation_cache.clear()
+            retire_predictors(current, artifacts)
+            print(f"Artifacts swapped in: dataset {artifacts['dataset_version']} ({artifacts['dataset_format']}), "
+                  f"models {artifacts['model_version']} ({artifacts['model_backend'] or 'dummy'})")
+
+        if artifacts['dataset_version'] and (APP_ROLE == 'model-server' or artifacts['dataset_format'] == 'columns'):
+            try:
+                share_dataset(artifacts)
+            except Exception as e:
+                print(f"Error sharing dataset: {e}")
+
+        dataset_ready.set()
+        models_ready.set()
+        return bool(updates)
+
+def model_server_status():
+    """What the model server reports to web workers (model-server role)."""
+    current = artifacts
+    return {
+        'dataset': bootstrap_status['dataset'],
+        'models': bootstrap_status['models'],
+        'use_dummy': current['use_dummy'],
+        'model_version': current['model_version'],
+        'model_backend': current['model_backend'],
+        'model_generations': current['model_generations'],
+        'dataset_version': current['dataset_version'],
+        'dataset_format': current['dataset_format'],
+        'dataset_generation': current['dataset_generation'],
+        # Only offered to workers once its columns and derived artifacts are written
+        'dataset_path': os.path.join(SHARED_DATASET_DIR, current['dataset_version'])
+        if current['dataset_version'] and shared_dataset['version'] == current['dataset_version'] else None
+    }
+
+def sync_model_server():
+    """Follow the model server's snapshot (web role with MODEL_SERVER_ADDRESS).
+
+    Models become RemotePredictors for the server's model version, the dataset
+    is memory-mapped from the columns the server shared and its derived
+    artifacts are loaded rather than rebuilt. Readiness is only signalled once
+    the server has finished its own first load.
+    """
+    global artifacts
+    try:
+        status = call_model_server(('status',))
+    except Exception as e:
+        print(f"Model server unavailable: {e}")
+        return False
+
+    with artifacts_reload_lock:
+        current = artifacts
+        updates = {}
+        if status['dataset_path'] and status['dataset_version'] != current['dataset_version']:
+            try:
+                loaded = columnar.read_dataset(status['dataset_path'])
+                with open(os.path.join(status['dataset_path'], DERIVED_ARTIFACTS_FILE), 'rb') as f:
+                    derived = pickle.load(f)
+                updates.update(dataset_artifacts(
+                    loaded, status['dataset_version'], status['dataset_format'], status['dataset_generation'],
+                    derived))
+            except Exception as e:
+                print(f"Error loading shared dataset: {e}")
+        if status['model_version'] != current['model_version']:
+            if status['use_dummy']:
+                updates.update(DUMMY_MODEL_ARTIFACTS)
+            else:
+                updates.update({
+                    'use_dummy': False,
+                    'history_predictor': RemotePredictor('history'),
+                    'coldstart_predictor': RemotePredictor('cold_start'),
+                    'model_version': status['model_version'],
+                    'model_backend': status['model_backend'],
+                    'model_generations': status['model_generations']
+                })
+
+        if updates:
+            artifacts = {**current, **updates}
+            with recommendation_cache_lock:
+                recommendation_cache.clear()
+            print(f"Artifacts synced from model server: dataset {artifacts['dataset_version']}, "
+                  f"models {artifacts['model_version']}")
+
+        if status['dataset'] in ('ready', 'failed') and (artifacts['dataset_version'] or status['dataset'] == 'failed'):
+            bootstrap_status['dataset'] = status['dataset']
+            dataset_ready.set()
+        if status['models'] in ('ready', 'failed'):
+            bootstrap_status['models'] = status['models']
+            models_ready.set()
+        return bool(updates)
+
+def watch_artifacts():
+    while True:
+        try:
+            reload_artifacts()
+        except Exception as e:
+            print(f"Artifact reload error: {e}")
+        if ARTIFACT_POLL_INTERVAL <= 0:
+            return
+        time.sleep(ARTIFACT_POLL_INTERVAL)
+
+def reload_model_server():
+    """Have the model server check the bucket now, then pick up what it loaded."""
+    try:
+        call_model_server(('reload',), timeout=None)
+    except Exception as e:
+        print(f"Model server reload error: {e}")
+    sync_model_server()
+
+def watch_model_server():
+    while True:
+        try:
+            sync_model_server()
+        except Exception as e:
+            print(f"Model server sync error: {e}")
+        time.sleep(MODEL_SERVER_POLL_INTERVAL)
+
+if APP_ROLE != 'script':
+    threading.Thread(target=watch_model_server if use_model_server else watch_artifacts, daemon=True).start()
+
+def not_ready_response(message):
+    response = jsonify({
+        'status': False,
+        'message': message
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def process_predictions(index, predictions, today=None, k=10):
+    """Return the k highest-scoring matches, optionally only those on or after today."""
+    try:
+        if not index['records']:
             return []
-            
+
+        records = index['records']
+        scores = np.asarray(predictions[0], dtype=float)[:len(records)]
+        candidates = np.arange(len(scores))
+        if today is not None:
+            # NaT dates compare as False, so unparseable dates drop out here
+            candidates = np.flatnonzero(index['dates'][:len(scores)] >= np.datetime64(today, 'D'))
+
+        k = min(k, len(candidates))
+        if k == 0:
+            return []
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+
         recommendations = []
-        for idx, score in enumerate(predictions[0]):
-            match = dataset.iloc[idx]
+        for idx in top:
+            match = records[idx]
             recommendations.append({
-                "id_match": str(match['ID Match']),
-                "home_team": match['Home'].strip(),
-                "away_team": match['Away'].strip(),
-                "tanggal": match['Tanggal'].strip(),
-                "jam": match['Jam'].rsplit(':', 1)[0],
-                "stadion": match['Stadion'],
-                "lokasi": match['Lokasi'],
-                "tiket_terjual": int(match['Jumlah Tiket Terjual']),
-                "score": float(score)
+                "id_match": str(match['id_match']),
+                "home_team": match['home_team'],
+                "away_team": match['away_team'],
+                "tanggal": match['tanggal'],
+                "jam": match['jam'],
+                "stadion": match['stadion'],
+                "lokasi": match['lokasi'],
+                "tiket_terjual": match['tiket_terjual'],
+                "score": float(scores[idx])
             })
-        return sorted(recommendations, key=lambda x: x['score'], reverse=True)[:10]
+        return recommendations
     except Exception as e:
         print(f"Error processing predictions: {e}")
         return []
@@ -294,8 +2049,9 @@ def register():
                 'message': 'Email and password are required'
             }), 400
             
-        existing = db.collection('users').where('email', '==', data['email']).get()
-        if len(list(existing)) > 0:
+        # Users not yet in the email index must still block their email
+        existing_id, _ = find_user_by_email(data['email'], legacy=True)
+        if existing_id is not None:
             return jsonify({
                 'status': False,
                 'message': 'Email already registered'
@@ -303,13 +2059,12 @@ def register():
             
         user_data = {
             'email': data['email'],
-            'password': bcrypt.hashpw(data['password'].encode('utf-8'), 
-                                    bcrypt.gensalt()).decode('utf-8'),
+            'password': password_hasher.hash(data['password']),
             'name': data.get('name', ''),
             'favorite_team': data.get('favorite_team', ''),
             'birth_date': data.get('birth_date'),
             'profile_picture': data.get('profile_picture', ''),
-            'purchase_history': []
+            'purchase_summary': empty_purchase_summary()
         }
         
         new_user_ref = db.collection('users').document()
@@ -319,7 +2074,8 @@ def register():
             'created_at': firestore.SERVER_TIMESTAMP,
             'updated_at': firestore.SERVER_TIMESTAMP
         }
-        new_user_ref.set(user_data_with_timestamps)
+        # Fails if a concurrent registration reserved the same email first
+        create_user_with_email(new_user_ref, user_data_with_timestamps)
         
         token = generate_token(new_user_ref.id)
         
@@ -336,6 +2092,13 @@ def register():
             }
         }), 201
         
+    except EmailTaken:
+        return jsonify({
+            'status': False,
+            'message': 'Email already registered'
+        }), 409
+    except PasswordHasherBusy:
+        return not_ready_response('Too many password operations in progress, please retry shortly')
     except Exception as e:
         return jsonify({
             'status': False,
@@ -352,35 +2115,41 @@ def login():
                 'message': 'Email and password are required'
             }), 400
             
-        users = list(db.collection('users').where('email', '==', data['email']).get())
-        if not users:
+        # Never check the password against a cached (possibly just changed) document
+        user_id, user_data = find_user_by_email(data['email'], fresh=True)
+        if not user_data:
             return jsonify({
                 'status': False,
                 'message': 'Invalid credentials'
             }), 401
-            
-        user = users[0]
-        user_data = user.to_dict()
         
-        if not bcrypt.checkpw(data['password'].encode('utf-8'), 
-                            user_data['password'].encode('utf-8')):
+        if not password_hasher.check(data['password'], user_data['password']):
             return jsonify({
                 'status': False,
                 'message': 'Invalid credentials'
             }), 401
+        
+        # Move the stored hash to the configured cost while the password is at hand
+        if password_hasher.needs_rehash(user_data['password']):
+            try:
+                db.collection('users').document(user_id).update({'password': password_hasher.hash(data['password'])})
+                invalidate_user(user_id)
+            except Exception as e:
+                print(f"Password rehash skipped for {user_id}: {e!r}")
             
-        user.reference.update({'token_invalidated_at': None})
-        token = generate_token(user.id)
+        token = generate_token(user_id)
         
         return jsonify({
             'status': True,
             'message': 'Login successful',
             'data': {
                 'token': token,
-                'user_id': user.id
+                'user_id': user_id
             }
         }), 200
         
+    except PasswordHasherBusy:
+        return not_ready_response('Too many password operations in progress, please retry shortly')
     except Exception as e:
         return jsonify({
             'status': False,
@@ -391,8 +2160,11 @@ def login():
 @verify_token
 def logout():
     try:
+        revoke_tokens(request.user_id)
+        # Keeps logout effective for tokens issued before revocation epochs existed
         user_ref = db.collection('users').document(request.user_id)
         user_ref.update({'token_invalidated_at': firestore.SERVER_TIMESTAMP})
+        invalidate_user(request.user_id)
         return jsonify({
             'status': True,
             'message': 'Logout successful'
@@ -436,15 +2208,13 @@ def update_user(user_id):
                 'message': 'No data provided for update'
             }), 400
         
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+        if not get_user_data(user_id):
             return jsonify({
                 'status': False,
                 'message': 'User not found'
             }), 404
         
+        user_ref = db.collection('users').document(user_id)
         update_data = {}
         allowed_fields = ['name', 'favorite_team', 'birth_date', 'profile_picture']
         for field in allowed_fields:
@@ -457,6 +2227,9 @@ def update_user(user_id):
         }
         
         user_ref.update(update_data_with_timestamp)
+        invalidate_user(user_id)
+        if 'favorite_team' in update_data:
+            invalidate_recommendations(user_id)
         
         return jsonify({
             'status': True,
@@ -473,14 +2246,20 @@ def update_user(user_id):
 @app.route('/api/users/<user_id>', methods=['DELETE'])
 def delete_user(user_id):
     try:
-        user_ref = db.collection('users').document(user_id)
-        if not user_ref.get().exists:
+        user_data = get_user_data(user_id)
+        if not user_data:
             return jsonify({
                 'status': False,
                 'message': 'User not found'
             }), 404
         
-        user_ref.delete()
+        delete_purchases(user_id)
+        if user_data.get('email'):
+            release_email(user_data['email'], user_id)
+        db.collection(MATERIALIZED_COLLECTION).document(user_id).delete()
+        db.collection('users').document(user_id).delete()
+        invalidate_user(user_id)
+        invalidate_recommendations(user_id)
         return jsonify({
             'status': True,
             'message': 'User deleted successfully'
@@ -496,38 +2275,53 @@ def delete_user(user_id):
 def add_purchase(user_id):
     try:
         data = request.json
-        required_fields = [
-            'match_id', 'home_team', 'away_team', 'stadium', 
-            'match_date', 'purchase_date', 'ticket_quantity'
-        ]
-        if not all(field in data for field in required_fields):
+        if not all(field in data for field in PURCHASE_REQUIRED_FIELDS):
                 return jsonify({
                     'status': False,
-                    'message': f'Required fields: {", ".join(required_fields)}'
+                    'message': f'Required fields: {", ".join(PURCHASE_REQUIRED_FIELDS)}'
                 }), 400
+
+        # Match details come from the dataset, so it has to be loaded
+        if not dataset_ready.is_set():
+            return not_ready_response('Dataset is still loading, please retry shortly')
+        index = artifacts['match_index']
+        if not index['records']:
+            # Failed or empty load: no match id can be checked, which is not the client's fault
+            return not_ready_response('Match data is not available, please retry later')
+        try:
+            purchase = build_purchase(index, data, date.today())
+        except ValueError as e:
+            return jsonify({
+                'status': False,
+                'message': str(e)
+            }), 400
         
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+        user_data = get_user_data(user_id)
+        if not user_data:
             return jsonify({
                 'status': False,
                 'message': 'User not found'
             }), 404
-        
-        purchase = {
-            'match_id': data['match_id'],
-            'home_team': data['home_team'],
-            'away_team': data['away_team'],
-            'stadium': data['stadium'],
-            'match_date': data['match_date'],
-            'purchase_date': data['purchase_date'],
-            'ticket_quantity': data['ticket_quantity']
-        }
-        
-        user_ref.update({
-            'purchase_history': firestore.ArrayUnion([purchase])
-        })
+
+        # A legacy array has to be moved first; a migration that lost a race with
+        # another write is simply retried
+        for attempt in range(PURCHASE_MIGRATION_ATTEMPTS):
+            if attempt or 'purchase_history' in user_data:
+                migrate_purchase_history(user_id)
+            try:
+                recorded = record_purchase(user_id, purchase)
+                break
+            except PurchaseHistoryPending:
+                continue
+        else:
+            return not_ready_response('Purchase history is being migrated, please retry shortly')
+        if not recorded:
+            # Deleted after the check above
+            return jsonify({
+                'status': False,
+                'message': 'User not found'
+            }), 404
+        invalidate_recommendations(user_id)
         
         return jsonify({
             'status': True,
@@ -544,22 +2338,29 @@ def add_purchase(user_id):
 @app.route('/api/users/<user_id>/purchases', methods=['GET'])
 def get_purchase_history(user_id):
     try:
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+        user_data = get_user_data(user_id)
+        if not user_data:
             return jsonify({
                 'status': False,
                 'message': 'User not found'
             }), 404
         
-        user_data = user_doc.to_dict()
-        purchase_history = user_data.get('purchase_history', [])
+        if 'purchase_history' in user_data:
+            migrate_purchase_history(user_id)
+            user_data = get_user_data(user_id)
+        
+        try:
+            result = list_purchases(user_id, request.args, get_purchase_summary(user_data)['count'])
+        except ValueError as e:
+            return jsonify({
+                'status': False,
+                'message': str(e)
+            }), 400
         
         return jsonify({
             'status': True,
             'message': 'Purchase history retrieved successfully',
-            'data': purchase_history
+            **result
         }), 200
         
     except Exception as e:
@@ -568,14 +2369,106 @@ def get_purchase_history(user_id):
             'message': str(e)
         }), 500
 
+# Standings proxy cache: served from memory, revalidated against the upstream in
+# the background once older than STANDINGS_TTL, with the last good copy kept on disk
+STANDINGS_URL = os.getenv('STANDINGS_URL', 'https://s.id/bolatix-standings')
+STANDINGS_TTL = int(os.getenv('STANDINGS_TTL', 300))
+STANDINGS_CACHE_PATH = os.getenv('STANDINGS_CACHE_PATH', '/tmp/standings.json')
+STANDINGS_TIMEOUT = (float(os.getenv('STANDINGS_CONNECT_TIMEOUT', 3)), float(os.getenv('STANDINGS_READ_TIMEOUT', 5)))
+
+standings_session = requests.Session()
+standings_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+standings_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+standings_lock = threading.Lock()
+standings_refresh_lock = threading.Lock()
+
+def load_standings_from_disk():
+    try:
+        with open(STANDINGS_CACHE_PATH) as f:
+            cached = json.load(f)
+        # Whatever is on disk is treated as stale and revalidated on first use
+        cached['fetched_at'] = 0
+        return cached
+    except (OSError, ValueError):
+        return {'data': None, 'etag': None, 'last_modified': None, 'url': None, 'fetched_at': 0}
+
+standings_cache = load_standings_from_disk()
+
+def save_standings_to_disk(cached):
+    try:
+        partial_path = f"{STANDINGS_CACHE_PATH}.part"
+        with open(partial_path, 'w') as f:
+            json.dump(cached, f)
+        os.replace(partial_path, STANDINGS_CACHE_PATH)
+    except OSError as e:
+        print(f"Error saving standings cache: {e}")
+
+def refresh_standings():
+    """Revalidate the cached standings against the upstream, raising on failure."""
+    global standings_cache
+    cached = standings_cache
+    headers = {}
+    if cached['data'] is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    # Go straight to where the URL shortener pointed last time
+    url = cached['url'] or STANDINGS_URL
+    try:
+        response = standings_session.get(url, headers=headers, timeout=STANDINGS_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException:
+        if url == STANDINGS_URL:
+            raise
+        response = standings_session.get(STANDINGS_URL, headers=headers, timeout=STANDINGS_TIMEOUT)
+        response.raise_for_status()
+
+    if response.status_code == 304:
+        refreshed = {**cached, 'fetched_at': time.time()}
+    else:
+        refreshed = {
+            'data': response.json(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'url': response.url,
+            'fetched_at': time.time()
+        }
+        save_standings_to_disk(refreshed)
+
+    with standings_lock:
+        standings_cache = refreshed
+    return refreshed
+
+def refresh_standings_in_background():
+    # Only one revalidation in flight; everyone else keeps serving the stale copy
+    if not standings_refresh_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refresh_standings()
+        except Exception as e:
+            print(f"Error refreshing standings: {e}")
+        finally:
+            standings_refresh_lock.release()
+
+    threading.Thread(target=run, daemon=True).start()
+
+def get_standings_data():
+    """Return the standings, fetching synchronously only when nothing is cached yet."""
+    cached = standings_cache
+    if cached['data'] is None:
+        return refresh_standings()['data']
+    if time.time() - cached['fetched_at'] > STANDINGS_TTL:
+        refresh_standings_in_background()
+    return cached['data']
+
 @app.route('/api/standings', methods=['GET'])
 def get_standings():
     try:
-        url = 'https://s.id/bolatix-standings'
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        standings_data = response.json()
+        standings_data = get_standings_data()
         
         return jsonify({
             'status': True,
@@ -604,6 +2497,11 @@ def recommend_teamfavorite():
                 'message': 'User ID is required'
             }), 400
         
+        if not models_ready.is_set():
+            return not_ready_response('Recommendations are still loading, please retry shortly')
+
+        current = artifacts
+        generation = recommendation_generation(user_id)
         # Fetch user data
         user_data = get_user_data(user_id)
         if not user_data:
@@ -612,69 +2510,46 @@ def recommend_teamfavorite():
                 'message': 'User not found'
             }), 404
 
-        today_date = datetime.today().date()
-
-        if USE_DUMMY:
-            favorite_team = user_data.get('favorite_team', '')
-            if not favorite_team:
-                return jsonify({
-                    'status': False,
-                    'message': 'Favorite team is required for dummy recommendations'
-                }), 400
+        # Repeat hits skip the model entirely
+        recommendations = get_cached_recommendations(current, 'teamfavorite', user_id, user_data)
+        if recommendations is None:
+            today_date = datetime.today().date()
 
-            # Convert favorite_team to lowercase for case-insensitive matching
-            favorite_team = favorite_team.lower()
-
-            recommendations = []
-            for _, match in dataset.iterrows():
-                match_date = None
-                try:
-                    match_date = datetime.strptime(match['Tanggal'], '%d/%m/%Y').date()
-                except ValueError:
-                    try:
-                        match_date = datetime.strptime(match['Tanggal'], '%d-%m-%Y').date()
-                    except ValueError:
-                        continue
-
-                # Convert team names to lowercase for case-insensitive matching
-                home_team = match['Home'].strip().lower()
-                away_team = match['Away'].strip().lower()
-
-                if favorite_team in [home_team, away_team] and match_date >= today_date:
-                    recommendations.append(format_match_recommendation(match))
-
-            recommendations = recommendations[:10]
-        else:
-            # Predict recommendations based on user data
-            if user_data.get('purchase_history'):
-                predictions = model_history.predict([user_id])
-            else:
-                favorite_team = user_data.get('favorite_team')
+            if current['use_dummy']:
+                favorite_team = user_data.get('favorite_team', '')
                 if not favorite_team:
                     return jsonify({
                         'status': False,
-                        'message': 'Favorite team is required for recommendations'
+                        'message': 'Favorite team is required for dummy recommendations'
                     }), 400
-                
-                predictions = model_coldstart.predict([[favorite_team]])
 
-            # Process predictions and filter by date
-            recommendations = []
-            for match in process_predictions(predictions):
-                match_date = None
-                try:
-                    match_date = datetime.strptime(match['tanggal'], '%d/%m/%Y').date()
-                except ValueError:
-                    try:
-                        match_date = datetime.strptime(match['tanggal'], '%d-%m-%Y').date()
-                    except ValueError:
-                        continue
+                # Team names are matched case-insensitively through the match index
+                index = current['match_index']
+                recommendations = match_records(index, upcoming_rows(index, [favorite_team], today_date)[:10])
+            else:
+                # Nightly precomputed results first, live inference on a miss
+                recommendations = get_materialized_recommendations(current, 'teamfavorite', user_id, user_data, today_date)
+
+            if recommendations is None:
+                # Predict recommendations based on user data
+                if get_purchase_summary(user_data)['count']:
+                    predictions = current['history_predictor'].predict(user_id)
+                else:
+                    favorite_team = user_data.get('favorite_team')
+                    if not favorite_team:
+                        return jsonify({
+                            'status': False,
+                            'message': 'Favorite team is required for recommendations'
+                        }), 400
+                
+                    predictions = current['coldstart_predictor'].predict([favorite_team])
 
-                if match_date >= today_date:
-                    recommendations.append(match)
+                # Top-k over upcoming matches only
+                recommendations = process_predictions(current['match_index'], predictions, today_date)
 
-        # Limit to top 10 recommendations
-        recommendations = recommendations[:10]
+            # Limit to top 10 recommendations
+            recommendations = recommendations[:10]
+            cache_recommendations(current, 'teamfavorite', user_id, user_data, recommendations, generation)
 
         return jsonify({
             'status': True,
@@ -700,6 +2575,11 @@ def recommend_history():
                 'message': 'User ID is required'
             }), 400
         
+        if not models_ready.is_set():
+            return not_ready_response('Recommendations are still loading, please retry shortly')
+
+        current = artifacts
+        generation = recommendation_generation(user_id)
         # Fetch user data
         user_data = get_user_data(user_id)
         if not user_data:
@@ -708,57 +2588,35 @@ def recommend_history():
                 'message': 'User not found'
             }), 404
 
-        if not user_data.get('purchase_history'):
-            return jsonify({
-                'status': False,
-                'message': 'Purchase history is required for recommendations'
-            }), 400
-
-        today_date = datetime.today().date()
-
-        # Extract relevant teams from purchase history
-        relevant_teams = {team.strip().lower() for purchase in user_data['purchase_history']
-                          for team in [purchase['home_team'], purchase['away_team']]}
-
-        recommendations = []
-
-        if USE_DUMMY:
-            # Generate recommendations from dummy data
-            for _, match in dataset.iterrows():
-                match_date = None
-                try:
-                    match_date = datetime.strptime(match['Tanggal'], '%d/%m/%Y').date()
-                except ValueError:
-                    try:
-                        match_date = datetime.strptime(match['Tanggal'], '%d-%m-%Y').date()
-                    except ValueError:
-                        continue
+        # Repeat hits skip the model entirely
+        recommendations = get_cached_recommendations(current, 'history', user_id, user_data)
+        if recommendations is None:
+            summary = get_purchase_summary(user_data)
+            if not summary['count']:
+                return jsonify({
+                    'status': False,
+                    'message': 'Purchase history is required for recommendations'
+                }), 400
 
-                # Convert team names to lowercase for case-insensitive matching
-                home_team = match['Home'].strip().lower()
-                away_team = match['Away'].strip().lower()
+            today_date = datetime.today().date()
 
-                if (home_team in relevant_teams or away_team in relevant_teams) and match_date >= today_date:
-                    recommendations.append(format_match_recommendation(match))
+            recommendations = None
 
-        else:
-            # Use the prediction model to generate recommendations
-            predictions = model_history.predict([user_id])
-            for match in process_predictions(predictions):
-                match_date = None
-                try:
-                    match_date = datetime.strptime(match['tanggal'], '%d/%m/%Y').date()
-                except ValueError:
-                    try:
-                        match_date = datetime.strptime(match['tanggal'], '%d-%m-%Y').date()
-                    except ValueError:
-                        continue
+            if current['use_dummy']:
+                # Rank upcoming matches by the user's decayed team affinity
+                index = current['match_index']
+                recommendations = match_records(index, affinity_rows(index, get_team_affinity(user_data), today_date))
 
-                if match_date >= today_date:
-                    recommendations.append(match)
+            else:
+                # Nightly precomputed results first, live inference on a miss
+                recommendations = get_materialized_recommendations(current, 'history', user_id, user_data, today_date)
+                if recommendations is None:
+                    predictions = current['history_predictor'].predict(user_id)
+                    recommendations = process_predictions(current['match_index'], predictions, today_date)
 
-        # Limit to top 10 recommendations
-        recommendations = recommendations[:10]
+            # Limit to top 10 recommendations
+            recommendations = recommendations[:10]
+            cache_recommendations(current, 'history', user_id, user_data, recommendations, generation)
 
         return jsonify({
             'status': True,
@@ -777,20 +2635,33 @@ def recommend_history():
 @app.route('/api/alldata', methods=['GET'])
 def alldata():
     try:
+        if not dataset_ready.is_set():
+            return not_ready_response('Dataset is still loading, please retry shortly')
+
         # Ensure the dataset is loaded
-        if dataset.empty:
+        current = artifacts
+        if current['alldata_response'] is None:
             return {
                 "status": False,
                 "message": "Dataset is empty or not loaded"
             }, 500
 
-        # Format all data from the dataset
-        all_data = [format_alldata(row) for _, row in dataset.iterrows()]
+        # Body is serialized once per dataset load; repeat polls revalidate with the ETag
+        if not ALLDATA_QUERY_PARAMS.intersection(request.args):
+            return send_cached_response(current['alldata_response'])
+
+        try:
+            result = query_alldata(current['match_index'], request.args)
+        except ValueError as e:
+            return {
+                "status": False,
+                "message": str(e)
+            }, 400
 
         return {
             "status": True,
             "message": "All data retrieved successfully",
-            "data": all_data
+            **result
         }, 200
 
     except Exception as e:
@@ -800,25 +2671,147 @@ def alldata():
             "message": "An error occurred while retrieving all data"
         }, 500
     
+@app.route('/api/matches/<id_match>', methods=['GET'])
+def get_match(id_match):
+    try:
+        if not dataset_ready.is_set():
+            return not_ready_response('Dataset is still loading, please retry shortly')
+
+        index = artifacts['match_index']
+        if not index['records']:
+            return not_ready_response('Match data is not available, please retry later')
+        try:
+            row = match_row(index, id_match)
+        except ValueError:
+            return {
+                "status": False,
+                "message": "id_match must be an integer"
+            }, 400
+        if row is None:
+            return {
+                "status": False,
+                "message": "Match not found"
+            }, 404
+
+        return {
+            "status": True,
+            "message": "Match retrieved successfully",
+            "data": {field: index['records'][row][field] for field in ALLDATA_FIELDS}
+        }, 200
+
+    except Exception as e:
+        print(f"Error retrieving match {id_match}: {e}")
+        return {
+            "status": False,
+            "message": "An error occurred while retrieving the match"
+        }, 500
+
+def ticket_analytics_response(kind, key):
+    """Serve one aggregate list, or a single entry when key is given."""
+    try:
+        if not dataset_ready.is_set():
+            return not_ready_response('Dataset is still loading, please retry shortly')
+
+        analytics = artifacts['ticket_analytics']
+        if analytics is None:
+            return {
+                "status": False,
+                "message": "Dataset is empty or not loaded"
+            }, 500
+
+        if not key:
+            return send_cached_response(analytics['responses'][kind])
+
+        entry = analytics[kind].get(normalize_name(key))
+        if entry is None:
+            return {
+                "status": False,
+                "message": f"No ticket sales found for {kind} {key}"
+            }, 404
+
+        return {
+            "status": True,
+            "message": f"Ticket sales per {kind} retrieved successfully",
+            "data": entry
+        }, 200
+
+    except Exception as e:
+        print(f"Error retrieving {kind} ticket analytics: {e}")
+        return {
+            "status": False,
+            "message": "An error occurred while retrieving ticket analytics"
+        }, 500
+
+@app.route('/api/analytics/tickets/teams', methods=['GET'])
+def ticket_analytics_teams():
+    return ticket_analytics_response('team', request.args.get('team'))
+
+@app.route('/api/analytics/tickets/stadiums', methods=['GET'])
+def ticket_analytics_stadiums():
+    return ticket_analytics_response('stadium', request.args.get('stadium'))
+
+@app.route('/api/analytics/tickets/months', methods=['GET'])
+def ticket_analytics_months():
+    return ticket_analytics_response('month', request.args.get('month'))
+
+@app.route('/api/analytics/tickets/top-fixtures', methods=['GET'])
+def ticket_analytics_top_fixtures():
+    try:
+        if not dataset_ready.is_set():
+            return not_ready_response('Dataset is still loading, please retry shortly')
+
+        current = artifacts
+        analytics = current['ticket_analytics']
+        if analytics is None:
+            return {
+                "status": False,
+                "message": "Dataset is empty or not loaded"
+            }, 500
+
+        try:
+            limit = int(request.args.get('limit', ANALYTICS_TOP_FIXTURES_DEFAULT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= ANALYTICS_TOP_FIXTURES_MAX:
+            return {
+                "status": False,
+                "message": f"limit must be an integer between 1 and {ANALYTICS_TOP_FIXTURES_MAX}"
+            }, 400
+
+        records = current['match_index']['records']
+        return {
+            "status": True,
+            "message": "Top fixtures by tickets sold retrieved successfully",
+            # Same fields as /api/alldata; the index records also carry suggested_action
+            "data": [{field: records[row][field] for field in ALLDATA_FIELDS}
+                     for row in analytics['fixture_order'][:limit]]
+        }, 200
+
+    except Exception as e:
+        print(f"Error retrieving top fixtures: {e}")
+        return {
+            "status": False,
+            "message": "An error occurred while retrieving ticket analytics"
+        }, 500
+
 @app.route('/api/users/<user_id>/profile-picture', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def manage_profile_picture(user_id):
     # GET: Retrieve profile picture URL
     if request.method == 'GET':
         try:
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            
-            if not user_doc.exists:
+            user_data = get_user_data(user_id)
+            if not user_data:
                 return jsonify({
                     'status': False, 
                     'message': 'User not found'
                 }), 404
             
-            profile_picture = user_doc.to_dict().get('profile_picture')
+            profile_picture = user_data.get('profile_picture')
             return jsonify({
                 'status': True,
                 'data': {
-                    'profile_picture_url': profile_picture or None
+                    'profile_picture_url': profile_picture or None,
+                    'profile_picture_urls': user_data.get('profile_picture_urls') or None
                 }
             }), 200
 
@@ -831,6 +2824,7 @@ def manage_profile_picture(user_id):
     # POST/PUT: Upload or replace profile picture
     if request.method in ['POST', 'PUT']:
         try:
+            request.max_content_length = PROFILE_PICTURE_MAX_REQUEST_BYTES
             if 'profile_picture' not in request.files:
                 return jsonify({
                     'status': False,
@@ -846,39 +2840,38 @@ def manage_profile_picture(user_id):
                     'message': f'Invalid file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'
                 }), 400
 
-            # Delete existing profile picture
+            # Upload new profile picture; older ones are removed in the background
             user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            
-            if user_doc.exists:
-                old_picture_url = user_doc.to_dict().get('profile_picture')
-                if old_picture_url:
-                    try:
-                        # Extract the full blob path, not just the filename
-                        blob_name = f"profile_pictures/{user_id}/{old_picture_url.split('/')[-1]}"
-                        old_blob = bucket.blob(blob_name)
-                        old_blob.delete()
-                        print(f"Deleted blob: {blob_name}")
-                    except Exception as storage_error:
-                        print(f"Error deleting from storage: {storage_error}")
-
-            # Upload new profile picture
-            picture_url = upload_profile_picture(file, user_id)
+            picture_urls = upload_profile_picture(file, user_id)
+            picture_url = picture_urls[PROFILE_PICTURE_DEFAULT_SIZE]
             
             # Update Firestore
             user_ref.update({
                 'profile_picture': picture_url,
+                'profile_picture_urls': picture_urls,
                 'updated_at': firestore.SERVER_TIMESTAMP
             })
+            invalidate_user(user_id)
 
             return jsonify({
                 'status': True,
                 'message': 'Profile picture updated successfully',
                 'data': {
-                    'profile_picture_url': picture_url
+                    'profile_picture_url': picture_url,
+                    'profile_picture_urls': picture_urls
                 }
             }), 200
 
+        except ValueError as e:
+            return jsonify({
+                'status': False,
+                'message': str(e)
+            }), 400
+        except RequestEntityTooLarge:
+            return jsonify({
+                'status': False,
+                'message': f'File too large. Maximum size is {PROFILE_PICTURE_MAX_BYTES // (1024 * 1024)} MB'
+            }), 413
         except Exception as e:
             return jsonify({
                 'status': False,
@@ -888,31 +2881,25 @@ def manage_profile_picture(user_id):
     # DELETE: Remove profile picture
     if request.method == 'DELETE':
         try:
-            user_ref = db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            
-            if not user_doc.exists:
+            user_data = get_user_data(user_id)
+            if not user_data:
                 return jsonify({
                     'status': False, 
                     'message': 'User not found'
                 }), 404
             
-            user_data = user_doc.to_dict()
+            user_ref = db.collection('users').document(user_id)
             old_picture_url = user_data.get('profile_picture')
             
             if old_picture_url:
-                try:
-                    blob_name = f"profile_pictures/{user_id}/{old_picture_url.split('/')[-1]}"
-                    old_blob = bucket.blob(blob_name)
-                    old_blob.delete()
-                    print(f"Deleted blob: {blob_name}")
-                except Exception as storage_error:
-                    print(f"Error deleting from storage: {storage_error}")
+                blob_deleter.enqueue(f"profile_pictures/{user_id}/", before=datetime.now(timezone.utc))
                 
                 user_ref.update({
                     'profile_picture': '',
+                    'profile_picture_urls': {},
                     'updated_at': firestore.SERVER_TIMESTAMP
                 })
+                invalidate_user(user_id)
             
             return jsonify({
                 'status': True,
@@ -925,6 +2912,42 @@ def manage_profile_picture(user_id):
                 'message': str(e)
             }), 500
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    current = artifacts
+    return jsonify({
+        'status': True,
+        'message': 'Service is running',
+        'data': {
+            'ready': dataset_ready.is_set() and models_ready.is_set(),
+            'dataset': bootstrap_status['dataset'],
+            'models': bootstrap_status['models'],
+            'use_dummy': current['use_dummy'],
+            'dataset_version': current['dataset_version'],
+            'dataset_format': current['dataset_format'],
+            'model_version': current['model_version'],
+            'model_backend': current['model_backend'],
+            'model_server': use_model_server,
+            'token_revocation_listener': token_revocation_status['listener']
+        }
+    }), 200
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    admin_token = os.getenv('ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token', '')
+    if not admin_token or not secrets.compare_digest(provided, admin_token):
+        return jsonify({
+            'status': False,
+            'message': 'Forbidden'
+        }), 403
+
+    threading.Thread(target=reload_model_server if use_model_server else reload_artifacts, daemon=True).start()
+    return jsonify({
+        'status': True,
+        'message': 'Artifact reload started'
+    }), 202
+
 def send_reset_email(user_email, reset_token):
     msg = Message('BolaTix Password Reset',
                   sender=app.config['MAIL_USERNAME'],
@@ -937,7 +2960,8 @@ Enter this code in the app to reset your password. This code will expire in 1 da
 
 If you did not request a password reset, please ignore this email and ensure your account is secure.
 '''
-    mail.send(msg)
+    # Delivered by the mail queue; the request does not wait on SMTP
+    mail_queue.enqueue(msg)
 
 @app.route('/forgot-password', methods=['POST'])
 def forgot_password():
@@ -952,26 +2976,24 @@ def forgot_password():
             }), 400
             
         # Check if user exists
-        users_ref = db.collection('users')
-        query = users_ref.where('email', '==', email).limit(1).get()
+        user_id, _ = find_user_by_email(email)
         
-        if not query:
+        if not user_id:
             return jsonify({
                 'status': True,
                 'message': 'If an account exists with this email, a password reset link will be sent.'
             }), 200
-            
-        user = query[0]
         
         # Generate reset token
         reset_token = secrets.token_urlsafe(32)
         expiration = datetime.utcnow() + timedelta(days=1)
         
         # Store reset token in user document
-        user.reference.update({
+        db.collection('users').document(user_id).update({
             'reset_token': reset_token,
             'reset_token_exp': expiration
         })
+        invalidate_user(user_id)
         
         # Send reset email
         send_reset_email(email, reset_token)
@@ -1024,7 +3046,7 @@ def reset_password():
             }), 400
             
         # Hash new password
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = password_hasher.hash(new_password)
         
         # Update password and remove reset token
         user.reference.update({
@@ -1032,12 +3054,15 @@ def reset_password():
             'reset_token': firestore.DELETE_FIELD,
             'reset_token_exp': firestore.DELETE_FIELD
         })
+        invalidate_user(user.id)
         
         return jsonify({
             'status': True,
             'message': 'Password has been reset successfully'
         }), 200
         
+    except PasswordHasherBusy:
+        return not_ready_response('Too many password operations in progress, please retry shortly')
     except Exception as e:
         return jsonify({
             'status': False,
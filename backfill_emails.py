@@ -0,0 +1,78 @@
+"""Write emails/{normalized email} mappings for users registered before the index existed.
+
+Usage:
+    python backfill_emails.py [--page-size N] [--dry-run]
+
+Safe to re-run: users whose mapping already points at them are skipped. When two
+users share an email that only differs in case, the first one keeps the mapping
+and the other is reported so it can be merged or renamed by hand. Once it has
+run, set EMAIL_LEGACY_LOOKUP=0 so logins no longer fall back to the email query.
+"""
+import argparse
+import os
+import time
+
+os.environ['APP_ROLE'] = 'script'
+
+from firebase_admin import firestore  # noqa: E402
+
+from app import db, email_ref, iter_document_pages  # noqa: E402
+
+
+@firestore.transactional
+def claim_email(transaction, mapping_ref, user_id):
+    """Point mapping_ref at user_id unless another existing user owns it; returns the outcome."""
+    mapping = mapping_ref.get(transaction=transaction)
+    if mapping.exists:
+        owner_id = mapping.to_dict().get('user_id')
+        if owner_id == user_id:
+            return 'present'
+        # A mapping left behind by a deleted user is taken over
+        if db.collection('users').document(owner_id).get(transaction=transaction).exists:
+            return 'conflict'
+    transaction.set(mapping_ref, {'user_id': user_id, 'created_at': firestore.SERVER_TIMESTAMP})
+    return 'indexed'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=200, help='users read per query')
+    parser.add_argument('--dry-run', action='store_true', help='only report mappings that are missing')
+    args = parser.parse_args()
+
+    started = time.time()
+    scanned = 0
+    counts = {'indexed': 0, 'present': 0, 'conflict': 0, 'failed': 0}
+    for page in iter_document_pages(db.collection('users'), args.page_size):
+        for snapshot in page:
+            scanned += 1
+            email = (snapshot.to_dict() or {}).get('email')
+            if not email:
+                continue
+            mapping_ref = email_ref(email)
+
+            if args.dry_run:
+                mapping = mapping_ref.get()
+                if mapping.exists and mapping.to_dict().get('user_id') == snapshot.id:
+                    counts['present'] += 1
+                else:
+                    counts['indexed'] += 1
+                    print(f"Would index {email} -> {snapshot.id}")
+                continue
+
+            try:
+                outcome = claim_email(db.transaction(), mapping_ref, snapshot.id)
+            except Exception as e:
+                print(f"Failed to index {snapshot.id}: {e}")
+                counts['failed'] += 1
+                continue
+            counts[outcome] += 1
+            if outcome == 'conflict':
+                print(f"Conflict: {email} ({snapshot.id}) is already indexed for another user")
+
+    print(f"Scanned {scanned} users in {time.time() - started:.1f}s: "
+          + ', '.join(f"{count} {name}" for name, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Measure non-auth latency while a running server absorbs a login storm.
+
+Usage:
+    python bench_auth.py --url http://localhost:8080 --email user@example.com --password secret
+        [--logins 400] [--concurrency 32] [--probe /api/health] [--probe-interval 0.02]
+
+The probe route is sampled on its own first (baseline) and then while
+--concurrency threads send --logins login requests. p50/p99 of the probe in
+both phases and the login status counts (200, 401, 503 ...) are reported.
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+def sample_probe(session, url, interval, stop, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            session.get(url, timeout=30)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return "no samples"
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return f"p50 {p50:.1f} ms, p99 {p99:.1f} ms ({len(latencies)} samples)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--probe', default='/api/health', help='non-auth route to sample')
+    parser.add_argument('--probe-interval', type=float, default=0.02)
+    parser.add_argument('--baseline-seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    probe_url = args.url.rstrip('/') + args.probe
+    login_url = args.url.rstrip('/') + '/api/auth/login'
+    probe_session = requests.Session()
+
+    baseline = []
+    stop = threading.Event()
+    prober = threading.Thread(target=sample_probe, args=(probe_session, probe_url, args.probe_interval, stop, baseline))
+    prober.start()
+    time.sleep(args.baseline_seconds)
+    stop.set()
+    prober.join()
+
+    storm = []
+    stop = threading.Event()
+    prober = threading.Thread(target=sample_probe, args=(probe_session, probe_url, args.probe_interval, stop, storm))
+    prober.start()
+
+    local = threading.local()
+
+    def login(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.post(login_url, json={'email': args.email, 'password': args.password}, timeout=60)
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(login, range(args.logins)))
+    storm_seconds = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    statuses = Counter(status for status, _ in results)
+    print(f"Probe {args.probe} baseline:    {percentiles(baseline)}")
+    print(f"Probe {args.probe} login storm: {percentiles(storm)}")
+    print(f"Logins: {args.logins} in {storm_seconds:.1f}s ({args.logins / storm_seconds:.1f}/s), "
+          f"statuses {dict(statuses)}, latency {percentiles([ms for _, ms in results])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare inference backends: import/load time, worker RSS and per-request latency.
+
+Usage:
+    python bench_inference.py [--backends keras tflite savedmodel] [--model-dir /tmp]
+        [--model history|cold_start] [--sample VALUE] [--requests 500] [--batch-size 32]
+
+Each backend is measured in a fresh interpreter so import cost and memory are
+not shared: time to import the runtime and load the model, resident memory
+after loading, p50/p99 of single-sample predict calls (one request) and
+throughput of --batch-size batches (what BatchPredictor sends under load).
+Model files are looked up in --model-dir under the names the service uses.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def measure(args):
+    started = time.perf_counter()
+    import numpy as np
+    from inference import load_model, model_filename
+    model = load_model(os.path.join(args.model_dir, model_filename(args.model, args.backend)), args.backend)
+    load_seconds = time.perf_counter() - started
+
+    # Same sample layout as the endpoints: predict(user_id) vs predict([favorite_team])
+    sample = args.sample if args.model == 'history' else [args.sample]
+    model.predict(np.array([sample]))  # warm-up
+
+    latencies = []
+    for _ in range(args.requests):
+        request_started = time.perf_counter()
+        model.predict(np.array([sample]))
+        latencies.append((time.perf_counter() - request_started) * 1000)
+
+    batch = np.array([sample] * args.batch_size)
+    batch_started = time.perf_counter()
+    batches = max(args.requests // args.batch_size, 1)
+    for _ in range(batches):
+        model.predict(batch)
+    batch_seconds = time.perf_counter() - batch_started
+
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        'backend': args.backend,
+        'load_seconds': load_seconds,
+        'rss_mb': rss_mb(),
+        'p50_ms': float(p50),
+        'p99_ms': float(p99),
+        'batched_samples_per_second': batches * args.batch_size / batch_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['keras', 'tflite', 'savedmodel'])
+    parser.add_argument('--backend', help=argparse.SUPPRESS)
+    parser.add_argument('--model-dir', default='/tmp')
+    parser.add_argument('--model', choices=['history', 'cold_start'], default='cold_start')
+    parser.add_argument('--sample', default='Persija Jakarta', help='user id (history) or team name (cold_start)')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(measure(args)))
+        return
+
+    print(f"{'backend':<12}{'load s':>9}{'RSS MB':>9}{'p50 ms':>9}{'p99 ms':>9}{'batched/s':>12}")
+    for backend in args.backends:
+        command = [sys.executable, __file__, '--backend', backend, '--model-dir', args.model_dir,
+                   '--model', args.model, '--sample', args.sample,
+                   '--requests', str(args.requests), '--batch-size', str(args.batch_size)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            error = (result.stderr.strip().splitlines() or ['failed'])[-1]
+            print(f"{backend:<12}{error}")
+            continue
+        row = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{row['backend']:<12}{row['load_seconds']:>9.2f}{row['rss_mb']:>9.0f}"
+              f"{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['batched_samples_per_second']:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
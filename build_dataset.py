@@ -0,0 +1,54 @@
+"""Build the prebuilt column archive the service loads instead of parsing dataset.csv.
+
+Usage:
+    python build_dataset.py [--csv PATH] [--output build/dataset.columns.zip] [--upload]
+
+Parses the CSV with the same normalize_dataset the service uses (parsed dates,
+integer scores and ticket counts, teams/stadiums/locations as category codes)
+and writes one .npy file per column plus their string dictionaries
+(columnar.py). Without --csv the current data/dataset.csv is downloaded from
+the bucket. --upload stores the archive as data/dataset.columns.zip; instances
+pick it up on their next artifact check, unpack it once and memory-map the
+columns. Rebuild and upload whenever dataset.csv changes; until then the
+service parses the CSV again, as the archive no longer matches it.
+"""
+import argparse
+import os
+
+import pandas as pd
+
+import columnar
+
+os.environ['APP_ROLE'] = 'script'
+
+from app import (DATASET_BLOB_PATH, DATASET_COLUMNS_BLOB_PATH, DATASET_PATH, bucket,  # noqa: E402
+                 download_from_gcs, file_md5, normalize_dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', help='local dataset.csv (default: download it from the bucket)')
+    parser.add_argument('--output', default='build/dataset.columns.zip')
+    parser.add_argument('--upload', action='store_true', help=f"upload the archive to {DATASET_COLUMNS_BLOB_PATH}")
+    args = parser.parse_args()
+
+    csv_path = args.csv
+    if not csv_path:
+        csv_path = DATASET_PATH
+        if download_from_gcs(DATASET_BLOB_PATH, csv_path) is None:
+            raise SystemExit(f"Could not download {DATASET_BLOB_PATH}")
+
+    loaded = normalize_dataset(pd.read_csv(csv_path))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    # Versioned by the CSV's md5, so recommendation fingerprints match either source
+    columnar.write_archive(loaded, args.output, file_md5(csv_path))
+    print(f"{csv_path} ({os.path.getsize(csv_path)} bytes, {len(loaded)} rows) -> "
+          f"{args.output} ({os.path.getsize(args.output)} bytes)")
+
+    if args.upload:
+        bucket.blob(DATASET_COLUMNS_BLOB_PATH).upload_from_filename(args.output, content_type='application/zip')
+        print(f"Uploaded {args.output} to {DATASET_COLUMNS_BLOB_PATH}")
+
+
+if __name__ == '__main__':
+    main()
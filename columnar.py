@@ -0,0 +1,140 @@
+"""Column files for the parsed match dataset, memory-mapped when read.
+
+A dataset directory holds one .npy file per column plus meta.json:
+
+    numeric     the column's own integer/float/bool/datetime64 dtype
+    category    codes (-1 for missing) into meta.json's dictionaries, stored as
+                the smallest integer type pandas uses for that many categories,
+                so Categorical.from_codes maps them instead of casting a copy
+    text        codes into a dictionary, like category; read back as a
+                categorical too, so the values stay shared codes instead of
+                one Python string per row in every process
+
+Arrays are opened with mmap_mode='r', so every process reading the same
+directory shares its pages through the OS page cache. Directories are written
+under a temporary name and renamed into place, so readers never see a partial one.
+
+build_dataset.py ships a directory as a zip archive (write_archive); services
+unpack it once per version (extract_archive) and map the unpacked files.
+"""
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+
+def column_kind(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return 'category'
+    # Nullable extension dtypes (Int64, string ...) have no plain array to map
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+        return 'numeric'
+    return 'text'
+
+
+def code_dtype(size):
+    """The code dtype pandas gives a categorical with size categories."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def write_dataset(df, directory, version=None):
+    """Write df to directory unless it already exists; returns directory.
+
+    version is kept in meta.json (see archive_version).
+    """
+    if os.path.isdir(directory):
+        return directory
+    partial = f"{directory}.part-{os.getpid()}"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    try:
+        write_columns(df, partial, version)
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    try:
+        os.rename(partial, directory)
+    except OSError:
+        # Another process renamed its copy into place first
+        shutil.rmtree(partial, ignore_errors=True)
+    return directory
+
+
+def write_columns(df, directory, version):
+    columns, dictionaries = [], {}
+    for position, name in enumerate(df.columns):
+        series = df[name]
+        kind = column_kind(series)
+        filename = f"{position}.npy"
+        if kind == 'category':
+            dictionaries[name] = [str(value) for value in series.cat.categories]
+            values = series.cat.codes.to_numpy(dtype=code_dtype(len(dictionaries[name])))
+        elif kind == 'text':
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            dictionaries[name] = [str(value) for value in uniques]
+            values = codes.astype(code_dtype(len(dictionaries[name])))
+        else:
+            values = series.to_numpy()
+        np.save(os.path.join(directory, filename), values)
+        columns.append({'name': name, 'file': filename, 'kind': kind, 'dtype': str(series.dtype)})
+
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'version': version, 'rows': len(df), 'columns': columns, 'dictionaries': dictionaries}, f)
+
+
+def read_dataset(directory):
+    """Load a dataset directory as a DataFrame backed by memory-mapped arrays where possible."""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+
+    data = {}
+    for column in meta['columns']:
+        values = np.load(os.path.join(directory, column['file']), mmap_mode='r')
+        if column['kind'] in ('category', 'text'):
+            data[column['name']] = pd.Categorical.from_codes(values, meta['dictionaries'][column['name']])
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def write_archive(df, path, version):
+    """Write df as a zip archive of a dataset directory; returns path."""
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = write_dataset(df, os.path.join(scratch, 'dataset'), version)
+        with zipfile.ZipFile(f"{path}.part", 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(os.listdir(directory)):
+                archive.write(os.path.join(directory, name), name)
+    os.replace(f"{path}.part", path)
+    return path
+
+
+def archive_version(path):
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read('meta.json'))['version']
+
+
+def extract_archive(path, root):
+    """Unpack an archive to root/<version> unless that directory exists; returns the directory."""
+    directory = os.path.join(root, archive_version(path))
+    if os.path.isdir(directory):
+        return directory
+    partial = f"{directory}.part-{os.getpid()}"
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        with zipfile.ZipFile(path) as archive:
+            archive.extractall(partial)
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    try:
+        os.rename(partial, directory)
+    except OSError:
+        shutil.rmtree(partial, ignore_errors=True)
+    return directory
@@ -0,0 +1,72 @@
+"""Convert the Keras recommendation models for the tflite and savedmodel backends.
+
+Usage:
+    python convert_models.py --backend tflite [--quantize dynamic|float16] [--input-dir /tmp] [--output-dir build]
+    python convert_models.py --backend savedmodel
+
+Reads history.h5 and cold_start.h5 from --input-dir and writes history.tflite /
+cold_start.tflite (or history.savedmodel.zip / cold_start.savedmodel.zip) to
+--output-dir. Upload the results next to the originals in the bucket's models/
+folder and set INFERENCE_BACKEND to serve them.
+
+The string lookup layers of the models are not TFLite builtins, so conversion
+allows select TensorFlow ops; interpreters without them fail to load the file
+and the service falls back to the Keras models.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from inference import MODEL_NAMES, model_filename
+
+
+def convert_tflite(model, output_path, quantize):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    if quantize in ('dynamic', 'float16'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def convert_savedmodel(model, output_path):
+    import tensorflow as tf
+    with tempfile.TemporaryDirectory() as directory:
+        export_dir = os.path.join(directory, 'model')
+        if hasattr(model, 'export'):
+            model.export(export_dir)
+        else:
+            tf.saved_model.save(model, export_dir)
+        archive = shutil.make_archive(os.path.join(directory, 'archive'), 'zip', export_dir)
+        shutil.move(archive, output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['tflite', 'savedmodel'], required=True)
+    parser.add_argument('--quantize', choices=['none', 'dynamic', 'float16'], default='none',
+                        help='post-training quantization (tflite only)')
+    parser.add_argument('--input-dir', default='/tmp')
+    parser.add_argument('--output-dir', default='build')
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in MODEL_NAMES:
+        input_path = os.path.join(args.input_dir, model_filename(name, 'keras'))
+        output_path = os.path.join(args.output_dir, model_filename(name, args.backend))
+        model = tf.keras.models.load_model(input_path)
+        if args.backend == 'tflite':
+            convert_tflite(model, output_path, args.quantize)
+        else:
+            convert_savedmodel(model, output_path)
+        print(f"{input_path} ({os.path.getsize(input_path)} bytes) -> "
+              f"{output_path} ({os.path.getsize(output_path)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
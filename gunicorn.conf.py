@@ -0,0 +1,68 @@
+"""gunicorn settings: several web workers sharing one model server.
+
+With more than one worker, the master starts model_server.py next to them and
+restarts it if it exits. Workers then only hold the memory-mapped dataset
+columns and a socket to the model server, instead of each loading TensorFlow,
+the models and its own copy of the dataset.
+
+The app is not preloaded: the Firebase/Firestore gRPC clients created at import
+are not safe to use across fork, so every worker imports app.py itself.
+"""
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# One worker unless WEB_CONCURRENCY asks for more: each extra worker still holds
+# its own Python heap, caches and indexes, so scale up deliberately
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = False
+
+MODEL_SERVER_RESTART_DELAY = 2
+model_server = {'process': None, 'stopping': False}
+
+
+def start_model_server():
+    return subprocess.Popen([sys.executable, 'model_server.py'],
+                            env={**os.environ, 'APP_ROLE': 'model-server'})
+
+
+def watch_model_server(server):
+    while not model_server['stopping']:
+        process = model_server['process']
+        if process.poll() is not None and not model_server['stopping']:
+            server.log.warning(f"Model server exited with {process.returncode}, restarting")
+            time.sleep(MODEL_SERVER_RESTART_DELAY)
+            model_server['process'] = start_model_server()
+        time.sleep(1)
+
+
+def on_starting(server):
+    load_dotenv()
+    # Every worker and the model server must agree on these, so they are fixed
+    # here rather than generated per process
+    os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+    if server.cfg.workers <= 1:
+        return
+    os.environ.setdefault('MODEL_SERVER_ADDRESS', '/tmp/bolatix-models.sock')
+    os.environ.setdefault('MODEL_SERVER_AUTHKEY', secrets.token_hex(32))
+    model_server['process'] = start_model_server()
+    threading.Thread(target=watch_model_server, args=(server,), daemon=True).start()
+
+
+def on_exit(server):
+    model_server['stopping'] = True
+    process = model_server['process']
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,40 @@
+"""CPU-bound profile picture encoding, run in worker processes by app.py.
+
+Kept apart from app.py so worker processes only import Pillow, not the
+Flask app, Firebase clients or models.
+"""
+import io
+import warnings
+
+from PIL import Image, ImageOps
+
+# Refuse decompression bombs instead of only warning about them
+Image.MAX_IMAGE_PIXELS = 40_000_000
+warnings.simplefilter('error', Image.DecompressionBombWarning)
+
+WEBP_QUALITY = 80
+
+
+def build_variants(path, sizes):
+    """Re-encode the uploaded image at path as square WebP variants.
+
+    `sizes` maps a variant name to its edge length in pixels. The image is
+    rotated according to its EXIF orientation, center-cropped and never
+    upscaled; metadata (EXIF, ICC, XMP) is not carried over. Returns a dict of
+    variant name to WebP bytes, or raises ValueError for unreadable images.
+    """
+    try:
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (OSError, Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ValueError('Invalid image file')
+
+    variants = {}
+    for name, size in sizes.items():
+        edge = min(size, image.width, image.height)
+        thumbnail = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+        output = io.BytesIO()
+        thumbnail.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+        variants[name] = output.getvalue()
+    return variants
@@ -0,0 +1,165 @@
+"""Inference backends for the recommendation models.
+
+Each backend loads one model file and exposes predict(batch) -> np.ndarray, the
+only call BatchPredictor and the batch jobs make:
+
+    keras       the original .h5 files through tf.keras (full TensorFlow)
+    tflite      .tflite files from convert_models.py through the TFLite
+                interpreter (ai_edge_litert / tflite_runtime when installed,
+                tf.lite otherwise)
+    savedmodel  zipped SavedModel exports from convert_models.py, called
+                through their serving_default signature
+
+TensorFlow and the interpreters are imported only when a backend is loaded.
+"""
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+MODEL_NAMES = ['history', 'cold_start']
+BACKENDS = ('keras', 'tflite', 'savedmodel')
+MODEL_EXTENSIONS = {'keras': '.h5', 'tflite': '.tflite', 'savedmodel': '.savedmodel.zip'}
+
+
+def model_filename(name, backend):
+    return f"{name}{MODEL_EXTENSIONS[backend]}"
+
+
+def file_md5(path, chunk_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_string_dtype(dtype):
+    return dtype in (np.bytes_, np.object_, np.str_)
+
+
+def fit_rank(batch, rank):
+    # predict(user_id) batches are 1-D while the models take (batch, 1) inputs;
+    # Keras expands these on its own, the interpreters do not
+    while batch.ndim < rank:
+        batch = batch[..., np.newaxis]
+    return batch
+
+
+class KerasModel:
+    def __init__(self, path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(path)
+
+    def predict(self, batch):
+        return self.model.predict(batch)
+
+
+def load_interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """A TFLite interpreter resized to each batch; calls are serialized as the
+    interpreter is not thread-safe."""
+
+    def __init__(self, path, num_threads=None):
+        self.interpreter = load_interpreter_class()(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = fit_rank(np.asarray(batch), len(self.input['shape']))
+        if is_string_dtype(self.input['dtype']):
+            batch = np.vectorize(lambda value: str(value).encode('utf-8'), otypes=[object])(batch)
+        else:
+            batch = batch.astype(self.input['dtype'])
+
+        with self.lock:
+            if tuple(self.interpreter.get_input_details()[0]['shape']) != batch.shape:
+                self.interpreter.resize_tensor_input(self.input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+            self.interpreter.set_tensor(self.input['index'], batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output['index']).copy()
+
+
+# Extracted SavedModel versions other than the one being loaded are removed once
+# they have not been touched for this long, so a process still loading one keeps it
+SAVEDMODEL_STALE_SECONDS = 600
+
+
+def extract_savedmodel(path):
+    """Extract a zipped SavedModel into a directory named after the archive's md5.
+
+    Each version gets its own directory, filled under a temporary name and renamed
+    into place, so a reload never writes over files another load is reading.
+    """
+    base = path[:-len('.zip')]
+    directory = f"{base}.{file_md5(path)[:12]}"
+    if not os.path.isdir(directory):
+        staging = tempfile.mkdtemp(prefix=os.path.basename(base) + '.', dir=os.path.dirname(base) or '.')
+        try:
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(staging)
+            os.rename(staging, directory)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Another process renamed the same version into place first
+            if not os.path.isdir(directory):
+                raise
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    for stale in glob.glob(f"{glob.escape(base)}.*"):
+        if stale != directory and os.path.isdir(stale) and \
+                time.time() - os.path.getmtime(stale) > SAVEDMODEL_STALE_SECONDS:
+            shutil.rmtree(stale, ignore_errors=True)
+    return directory
+
+
+class SavedModel:
+    def __init__(self, path):
+        import tensorflow as tf
+        self.tf = tf
+        directory = extract_savedmodel(path) if path.endswith('.zip') else path
+        self.loaded = tf.saved_model.load(directory)
+        self.signature = self.loaded.signatures['serving_default']
+        self.input_name, self.input_spec = next(iter(self.signature.structured_input_signature[1].items()))
+
+    def predict(self, batch):
+        batch = fit_rank(np.asarray(batch), self.input_spec.shape.rank or 1)
+        if self.input_spec.dtype == self.tf.string:
+            batch = batch.astype(str)
+        tensor = self.tf.convert_to_tensor(batch, dtype=self.input_spec.dtype)
+        outputs = self.signature(**{self.input_name: tensor})
+        return next(iter(outputs.values())).numpy()
+
+
+def load_model(path, backend):
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if backend == 'keras':
+        return KerasModel(path)
+    if backend == 'tflite':
+        return TFLiteModel(path, num_threads=int(os.getenv('TFLITE_NUM_THREADS', 1)))
+    if backend == 'savedmodel':
+        return SavedModel(path)
+    raise ValueError(f"Unknown inference backend: {backend}")
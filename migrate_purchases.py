@@ -0,0 +1,57 @@
+"""Move purchase_history arrays on user documents into users/{user_id}/purchases.
+
+Usage:
+    python migrate_purchases.py [--user USER_ID] [--page-size N] [--dry-run]
+
+Safe to re-run: migrated users are skipped and an interrupted user is rewritten
+under the same purchase document ids. Users that were not migrated yet are also
+migrated on their next purchase or purchase history read.
+"""
+import argparse
+import os
+import time
+
+os.environ['APP_ROLE'] = 'script'
+
+from app import db, iter_document_pages, migrate_purchase_history  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--user', help='migrate a single user id')
+    parser.add_argument('--page-size', type=int, default=200, help='users read per query')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be migrated')
+    args = parser.parse_args()
+
+    if args.user:
+        snapshots = [db.collection('users').document(args.user).get()]
+    else:
+        snapshots = (snapshot for page in iter_document_pages(db.collection('users'), args.page_size)
+                     for snapshot in page)
+
+    started = time.time()
+    scanned = users = purchases = 0
+    for snapshot in snapshots:
+        scanned += 1
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data or 'purchase_history' not in data:
+            continue
+
+        if args.dry_run:
+            moved = len(data.get('purchase_history') or [])
+        else:
+            try:
+                moved = migrate_purchase_history(snapshot.id)
+            except Exception as e:
+                print(f"Failed to migrate {snapshot.id}: {e}")
+                continue
+        users += 1
+        purchases += moved
+        print(f"{'Would migrate' if args.dry_run else 'Migrated'} {snapshot.id}: {moved} purchases")
+
+    print(f"Scanned {scanned} users, {'would migrate' if args.dry_run else 'migrated'} "
+          f"{users} users / {purchases} purchases in {time.time() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Serve the recommendation models to the gunicorn web workers over a Unix socket.
+
+Usage (started by gunicorn.conf.py when more than one worker runs):
+    MODEL_SERVER_ADDRESS=/tmp/bolatix-models.sock MODEL_SERVER_AUTHKEY=... python model_server.py
+
+Runs app.py in the 'model-server' role: it is the only process that downloads
+and loads the models and parses the dataset. The parsed dataset is written as
+memory-mapped column files (columnar.py) under SHARED_DATASET_DIR, so every
+worker maps the same pages instead of holding its own copy. Workers send
+
+    ('status',)                      the current snapshot (app.model_server_status)
+    ('predict', name, sample)        one sample through the model's BatchPredictor,
+                                     so requests from all workers share batches
+    ('predict_batch', name, batch)   a whole batch straight to the model
+    ('reload',)                      check the bucket for new artifacts now
+
+and get ('ok', payload) or ('error', message) back.
+"""
+import os
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+os.environ['APP_ROLE'] = 'model-server'
+
+import app  # noqa: E402  (reads APP_ROLE at import)
+
+PREDICTORS = {'history': 'history_predictor', 'cold_start': 'coldstart_predictor'}
+
+
+def handle(message):
+    kind = message[0]
+    if kind == 'status':
+        return app.model_server_status()
+    if kind == 'reload':
+        app.reload_artifacts()
+        return app.model_server_status()
+    if kind in ('predict', 'predict_batch'):
+        _, name, value = message
+        predictor = app.artifacts[PREDICTORS[name]]
+        if predictor is None:
+            raise RuntimeError('Models are not loaded')
+        if kind == 'predict':
+            return predictor.predict(value)
+        return predictor.model.predict(value)
+    raise ValueError(f"Unknown message: {kind}")
+
+
+def serve_connection(connection):
+    with connection:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = ('ok', handle(message))
+            except Exception as e:
+                reply = ('error', str(e) or repr(e))
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+
+def main():
+    address = app.MODEL_SERVER_ADDRESS
+    if not address:
+        raise SystemExit('MODEL_SERVER_ADDRESS is not set')
+    if os.path.exists(address):
+        # Left behind by a previous server that did not shut down cleanly
+        os.unlink(address)
+
+    with Listener(address, family='AF_UNIX', authkey=app.MODEL_SERVER_AUTHKEY) as listener:
+        print(f"Model server listening on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except AuthenticationError as e:
+                print(f"Rejected model server connection: {e}")
+                continue
+            threading.Thread(target=serve_connection, args=(connection,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Materialize every user's recommendations ahead of time, e.g. from a nightly job.
+
+Usage:
+    python precompute_recommendations.py [--page-size N] [--batch-size N] [--state PATH] [--restart]
+
+Users are streamed from Firestore in pages and scored with the history and
+cold-start models in large batches; the top upcoming matches per user are
+written to the recommendations collection, which the recommendation endpoints
+read before falling back to live inference.
+
+Progress is checkpointed to --state after every page. A rerun for the same
+dataset, models and day continues after the last finished page; --restart
+starts over.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+os.environ['APP_ROLE'] = 'script'
+
+import app  # noqa: E402
+
+
+def load_state(path, run):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('run') == run else None
+
+
+def save_state(path, state):
+    temp_path = f"{path}.part"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+def predict_in_batches(model, samples, batch_size):
+    if not samples:
+        return None
+    return np.concatenate([
+        np.asarray(model.predict(np.array(samples[start:start + batch_size])))
+        for start in range(0, len(samples), batch_size)
+    ])
+
+
+def materialize_page(current, page, today, batch_size):
+    """Build the materialized recommendation documents for one page of users."""
+    users = [(snapshot.id, snapshot.to_dict()) for snapshot in page if snapshot.exists]
+    buyers = [(user_id, data) for user_id, data in users if app.get_purchase_summary(data)['count']]
+    newcomers = [(user_id, data) for user_id, data in users
+                 if not app.get_purchase_summary(data)['count'] and data.get('favorite_team')]
+
+    history_predictions = predict_in_batches(
+        current['history_predictor'].model, [user_id for user_id, _ in buyers], batch_size
+    )
+    coldstart_predictions = predict_in_batches(
+        current['coldstart_predictor'].model, [[data['favorite_team']] for _, data in newcomers], batch_size
+    )
+
+    index = current['match_index']
+    documents = {}
+    for i, (user_id, data) in enumerate(buyers):
+        recommendations = app.process_predictions(index, history_predictions[i:i + 1], today)[:10]
+        documents[user_id] = {'teamfavorite': recommendations, 'history': recommendations}
+    for i, (user_id, data) in enumerate(newcomers):
+        recommendations = app.process_predictions(index, coldstart_predictions[i:i + 1], today)[:10]
+        documents[user_id] = {'teamfavorite': recommendations, 'history': None}
+
+    for user_id, data in users:
+        if user_id in documents:
+            documents[user_id].update({
+                **app.materialized_fingerprint(current, data, today),
+                'computed_at': app.firestore.SERVER_TIMESTAMP
+            })
+    return documents
+
+
+def write_documents(documents):
+    collection = app.db.collection(app.MATERIALIZED_COLLECTION)
+    items = list(documents.items())
+    for start in range(0, len(items), app.PURCHASE_WRITE_BATCH_SIZE):
+        batch = app.db.batch()
+        for user_id, document in items[start:start + app.PURCHASE_WRITE_BATCH_SIZE]:
+            batch.set(collection.document(user_id), document)
+        batch.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=500, help='users read per Firestore query')
+    parser.add_argument('--batch-size', type=int, default=512, help='samples per model.predict call')
+    parser.add_argument('--state', default='/tmp/precompute_recommendations.json', help='checkpoint file')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    app.reload_artifacts()
+    current = app.artifacts
+    if current['use_dummy']:
+        print("Models are not available; nothing to precompute")
+        return 1
+
+    today = datetime.today().date()
+    run = {
+        'dataset_version': current['dataset_version'],
+        'model_version': current['model_version'],
+        'date': today.isoformat()
+    }
+    state = None if args.restart else load_state(args.state, run)
+    if state:
+        print(f"Resuming after user {state['last_user_id']} ({state['users']} users done)")
+        # A field cursor rather than the user's snapshot, which is gone if the user was deleted
+        start_after = {'__name__': app.db.collection('users').document(state['last_user_id'])}
+    else:
+        state = {'run': run, 'last_user_id': None, 'users': 0, 'written': 0}
+        start_after = None
+
+    started = time.time()
+    processed = 0
+    for page in app.iter_document_pages(app.db.collection('users'), args.page_size, start_after):
+        documents = materialize_page(current, page, today, args.batch_size)
+        write_documents(documents)
+
+        processed += len(page)
+        state.update({
+            'last_user_id': page[-1].id,
+            'users': state['users'] + len(page),
+            'written': state['written'] + len(documents)
+        })
+        save_state(args.state, state)
+
+        elapsed = time.time() - started
+        print(f"{state['users']} users, {state['written']} materialized, "
+              f"{processed / elapsed if elapsed else 0:.1f} users/s")
+
+    elapsed = time.time() - started
+    print(f"Done: {processed} users this run ({state['users']} total, {state['written']} materialized) "
+          f"in {elapsed:.1f}s, {processed / elapsed if elapsed else 0:.1f} users/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
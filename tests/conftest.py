@@ -0,0 +1,53 @@
+"""Shared fixtures. app.py is imported in the script role, so it starts no
+background threads and loads no artifacts; only its pure helpers are tested."""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+os.environ['APP_ROLE'] = 'script'
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+RAW_MATCHES = [
+    # ID, home, away, score, lokasi, jam, stadion, tanggal, tickets
+    (1, ' Persebaya', 'PERSIS ', (0, 2), 'Surabaya', '19:00:00', 'Stadion Gelora Bung Tomo', '3/1/2025', 4863),
+    (2, ' PSS Sleman', 'Borneo FC ', (3, 3), 'Sleman', '19:00:00', 'Stadion Maguwoharjo', '17/1/2025', 7879),
+    (3, ' Persib', 'PSS Sleman ', (0, 3), 'Bandung', '15:30:00', 'Stadion GBLA', '3-2-2025', 15180),
+    (4, ' persebaya', 'Persib ', (1, 1), 'Surabaya', '19:00:00', 'Stadion Gelora Bung Tomo', '10/2/2025', 20000),
+    (5, ' Borneo FC', 'PERSIS ', (2, 0), 'Samarinda', '16:00:00', 'Stadion Segiri', 'TBD', 1000),
+]
+
+
+@pytest.fixture
+def raw_matches():
+    """Rows shaped like data/dataset.csv, with its stray spaces and mixed date formats."""
+    return pd.DataFrame([{
+        'ID Match': match_id,
+        'Match': f"{home.strip()} vs {away.strip()}",
+        'Score tim home': score[0],
+        'Score tim away': score[1],
+        'Home': home,
+        'Away': away,
+        'Lokasi': lokasi,
+        'Jam': jam,
+        'Waktu': 'Malam',
+        'Stadion': stadion,
+        'Hari': 'Weekend',
+        'Tanggal': tanggal,
+        'Jumlah Tiket Terjual': tickets
+    } for match_id, home, away, score, lokasi, jam, stadion, tanggal, tickets in RAW_MATCHES])
+
+
+@pytest.fixture
+def matches(raw_matches):
+    return app.normalize_dataset(raw_matches)
+
+
+@pytest.fixture
+def match_index(matches):
+    return app.build_match_index(matches)
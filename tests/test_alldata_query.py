@@ -0,0 +1,78 @@
+import pytest
+
+import app
+
+
+def ids(result):
+    return [record['id_match'] for record in result['data']]
+
+
+def test_default_page_has_every_field(match_index):
+    result = app.query_alldata(match_index, {})
+    assert ids(result) == [1, 2, 3, 4, 5]
+    assert set(result['data'][0]) == set(app.ALLDATA_FIELDS)
+    assert result['pagination'] == {'limit': app.ALLDATA_DEFAULT_LIMIT, 'total': 5, 'next_cursor': None}
+
+
+def test_cursor_walks_every_row_once(match_index):
+    seen, cursor = [], None
+    while True:
+        args = {'limit': '2', **({'cursor': cursor} if cursor else {})}
+        result = app.query_alldata(match_index, args)
+        seen += ids(result)
+        cursor = result['pagination']['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [1, 2, 3, 4, 5]
+
+
+def test_cursor_round_trip():
+    assert app.decode_cursor(app.encode_cursor(12345)) == 12345
+
+
+def test_field_projection(match_index):
+    result = app.query_alldata(match_index, {'fields': 'id_match, stadion', 'limit': '1'})
+    assert result['data'] == [{'id_match': 1, 'stadion': 'Stadion Gelora Bung Tomo'}]
+
+
+def test_filters_combine(match_index):
+    assert ids(app.query_alldata(match_index, {'team': 'persebaya'})) == [1, 4]
+    assert ids(app.query_alldata(match_index, {'stadium': 'STADION GBLA'})) == [3]
+    assert ids(app.query_alldata(match_index, {'lokasi': 'surabaya', 'date_from': '2025-02-01'})) == [4]
+    assert ids(app.query_alldata(match_index, {'team': 'PSS Sleman', 'date_to': '2025-01-31'})) == [2]
+    # Undated matches never fall inside a date range
+    assert ids(app.query_alldata(match_index, {'date_from': '2000-01-01'})) == [1, 2, 3, 4]
+
+
+def test_filtered_pages_carry_the_total(match_index):
+    result = app.query_alldata(match_index, {'team': 'Borneo FC', 'limit': '1'})
+    assert ids(result) == [2]
+    assert result['pagination']['total'] == 2
+    next_page = app.query_alldata(match_index, {'team': 'Borneo FC', 'cursor': result['pagination']['next_cursor']})
+    assert ids(next_page) == [5]
+
+
+@pytest.mark.parametrize('args', [
+    {'limit': '0'},
+    {'limit': str(app.ALLDATA_MAX_LIMIT + 1)},
+    {'limit': 'ten'},
+    {'fields': 'id_match,password'},
+    {'date_from': '01/02/2025'},
+    {'cursor': '!!'},
+])
+def test_invalid_parameters(match_index, args):
+    with pytest.raises(ValueError):
+        app.query_alldata(match_index, args)
+
+
+def test_filters_match_a_full_scan(match_index):
+    # Every combination of filters gives what filtering all rows one by one would
+    records = match_index['records']
+    for team in ('persebaya', 'PSS Sleman', 'nobody'):
+        for stadium in (None, 'stadion gelora bung tomo', 'Stadion GBLA'):
+            args = {'team': team, **({'stadium': stadium} if stadium else {}), 'date_to': '2025-02-28'}
+            expected = [record['id_match'] for record in records
+                        if team.lower() in (record['home_team'].lower(), record['away_team'].lower())
+                        and (stadium is None or record['stadion'].lower() == stadium.lower())
+                        and record['tanggal'] != 'TBD']
+            assert ids(app.query_alldata(match_index, args)) == expected, args
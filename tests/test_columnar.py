@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+import columnar
+
+
+def test_round_trip_keeps_values(matches, tmp_path):
+    directory = columnar.write_dataset(matches, str(tmp_path / 'v1'), version='v1')
+    loaded = columnar.read_dataset(directory)
+
+    assert list(loaded.columns) == list(matches.columns)
+    for column in matches.columns:
+        assert loaded[column].astype(object).tolist() == matches[column].astype(object).tolist(), column
+    assert loaded['ID Match'].dtype == matches['ID Match'].dtype
+    assert loaded['Tanggal Parsed'].dtype == matches['Tanggal Parsed'].dtype
+
+
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def test_numeric_columns_are_memory_mapped(matches, tmp_path):
+    loaded = columnar.read_dataset(columnar.write_dataset(matches, str(tmp_path / 'v1')))
+    assert is_memory_mapped(loaded['Jumlah Tiket Terjual'].to_numpy())
+
+
+def test_text_columns_read_back_as_categoricals(matches, tmp_path):
+    loaded = columnar.read_dataset(columnar.write_dataset(matches, str(tmp_path / 'v1')))
+    assert isinstance(loaded['Match'].dtype, pd.CategoricalDtype)
+    assert isinstance(loaded['Home'].dtype, pd.CategoricalDtype)
+
+
+def test_codes_are_memory_mapped(matches, tmp_path):
+    loaded = columnar.read_dataset(columnar.write_dataset(matches, str(tmp_path / 'v1')))
+    assert is_memory_mapped(loaded['Match'].array.codes)
+    assert is_memory_mapped(loaded['Home'].array.codes)
+
+
+def test_large_dictionaries_keep_mapped_codes(tmp_path):
+    df = pd.DataFrame({'text': pd.Series([f"match {i}" for i in range(300)], dtype=object)})
+    loaded = columnar.read_dataset(columnar.write_dataset(df, str(tmp_path / 'v1')))
+    assert loaded['text'].array.codes.dtype == np.int16
+    assert is_memory_mapped(loaded['text'].array.codes)
+    assert loaded['text'].astype(object).tolist() == df['text'].tolist()
+
+
+def test_missing_values(tmp_path):
+    df = pd.DataFrame({
+        'text': pd.Series(['a', None, 'b'], dtype=object),
+        'category': pd.Categorical(['x', None, 'x']),
+        'number': [1.5, np.nan, 2.0]
+    })
+    loaded = columnar.read_dataset(columnar.write_dataset(df, str(tmp_path / 'v1')))
+    assert loaded['text'].isna().tolist() == [False, True, False]
+    assert loaded['category'].isna().tolist() == [False, True, False]
+    assert np.isnan(loaded['number'][1])
+
+
+def test_derived_artifacts_match_the_parsed_dataset(matches, tmp_path):
+    loaded = columnar.read_dataset(columnar.write_dataset(matches, str(tmp_path / 'v1')))
+    assert app.build_match_index(loaded)['records'] == app.build_match_index(matches)['records']
+    assert app.build_alldata_response(loaded)['etag'] == app.build_alldata_response(matches)['etag']
+
+
+def test_existing_directory_is_kept(matches, tmp_path):
+    directory = columnar.write_dataset(matches, str(tmp_path / 'v1'))
+    columnar.write_dataset(matches.iloc[:1], directory)
+    assert len(columnar.read_dataset(directory)) == len(matches)
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path):
+    df = pd.DataFrame({'bad': pd.Series([{'not': 'hashable'}], dtype=object)})
+    with pytest.raises(Exception):
+        columnar.write_dataset(df, str(tmp_path / 'v1'))
+    assert os.listdir(tmp_path) == []
+
+
+def test_archive_round_trip(matches, tmp_path):
+    path = columnar.write_archive(matches, str(tmp_path / 'dataset.zip'), 'abc123')
+    assert columnar.archive_version(path) == 'abc123'
+    assert not os.path.exists(f"{path}.part")
+
+    directory = columnar.extract_archive(path, str(tmp_path / 'shared'))
+    assert directory == str(tmp_path / 'shared' / 'abc123')
+    assert columnar.read_dataset(directory)['ID Match'].tolist() == matches['ID Match'].tolist()
+
+
+def test_extracted_version_is_reused(matches, tmp_path):
+    path = columnar.write_archive(matches, str(tmp_path / 'dataset.zip'), 'abc123')
+    directory = columnar.extract_archive(path, str(tmp_path / 'shared'))
+    marker = os.path.join(directory, 'marker')
+    open(marker, 'w').close()
+    assert columnar.extract_archive(path, str(tmp_path / 'shared')) == directory
+    assert os.path.exists(marker)
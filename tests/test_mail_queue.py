@@ -0,0 +1,102 @@
+import socket
+import time
+
+import pytest
+from flask_mail import Mail, Message
+
+import app
+
+controller_module = pytest.importorskip('aiosmtpd.controller')
+
+
+class FlakyHandler:
+    """Accepts a message only after failing the first `failures` attempts."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.attempts = 0
+        self.delivered = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            return '451 Try again later'
+        self.delivered.append(envelope)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    """Start a local SMTP server and point the app's mail settings at it; yields a
+    function that installs a handler and returns a MailQueue delivering there."""
+    controllers = []
+
+    def start(handler, max_retries=2):
+        port = free_port()
+        controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        controllers.append(controller)
+        state = Mail().init_mail({
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': port,
+            'MAIL_USE_TLS': False,
+            'MAIL_USE_SSL': False,
+            'MAIL_SUPPRESS_SEND': False,
+            'MAIL_DEFAULT_SENDER': 'noreply@bolatix.test'
+        })
+        monkeypatch.setitem(app.app.extensions, 'mail', state)
+        return app.MailQueue(app.mail, workers=1, max_retries=max_retries, backoff=0.01, idle_seconds=0.1)
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def message(recipient='user@example.com'):
+    return Message('Password Reset Request', sender='noreply@bolatix.test', recipients=[recipient], body='reset')
+
+
+def test_delivers_queued_mail(smtp):
+    handler = FlakyHandler()
+    mail_queue = smtp(handler)
+    mail_queue.enqueue(message('a@example.com'))
+    mail_queue.enqueue(message('b@example.com'))
+    assert wait_for(lambda: len(handler.delivered) == 2)
+    assert sorted(envelope.rcpt_tos[0] for envelope in handler.delivered) == ['a@example.com', 'b@example.com']
+
+
+def test_retries_a_failed_send(smtp):
+    handler = FlakyHandler(failures=2)
+    mail_queue = smtp(handler, max_retries=2)
+    mail_queue.enqueue(message())
+    assert wait_for(lambda: len(handler.delivered) == 1)
+    assert handler.attempts == 3
+
+
+def test_gives_up_after_the_last_attempt(smtp, capsys):
+    handler = FlakyHandler(failures=100)
+    mail_queue = smtp(handler, max_retries=2)
+    mail_queue.enqueue(message('lost@example.com'))
+    output = []
+    assert wait_for(lambda: output.append(capsys.readouterr().out)
+                    or 'Giving up on mail to lost@example.com' in ''.join(output))
+    assert handler.attempts == 3
+    assert handler.delivered == []
+
+    # The worker keeps serving later messages
+    handler.failures = 0
+    mail_queue.enqueue(message('next@example.com'))
+    assert wait_for(lambda: len(handler.delivered) == 1)
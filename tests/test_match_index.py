@@ -0,0 +1,38 @@
+from datetime import date
+
+import numpy as np
+
+import app
+
+
+def test_records_follow_dataset_order(match_index):
+    assert [record['id_match'] for record in match_index['records']] == [1, 2, 3, 4, 5]
+    assert match_index['records'][0]['home_team'] == 'Persebaya'
+    assert match_index['records'][0]['suggested_action'] == 'Consider buying tickets'
+
+
+def test_teams_are_matched_ignoring_case_and_spaces(match_index):
+    assert app.team_rows(match_index, [' PERSEBAYA ']).tolist() == [0, 3]
+    assert app.team_rows(match_index, ['Persib', 'Borneo FC']).tolist() == [1, 2, 3, 4]
+    assert app.team_rows(match_index, ['Unknown FC']).tolist() == []
+
+
+def test_upcoming_rows_skip_past_and_undated_matches(match_index):
+    assert app.upcoming_rows(match_index, ['PSS Sleman'], date(2025, 1, 18)).tolist() == [2]
+    assert app.upcoming_rows(match_index, ['Borneo FC'], date(2025, 1, 1)).tolist() == [1]
+    assert app.upcoming_rows(match_index, ['Persebaya'], date(2025, 3, 1)).tolist() == []
+
+
+def test_incidence_marks_both_teams_of_each_match(match_index):
+    incidence = match_index['incidence']
+    team_ids = match_index['team_ids']
+    assert incidence.shape == (len(team_ids), 5)
+    assert incidence.sum(axis=0).tolist() == [2] * 5
+    assert incidence[team_ids['persebaya']].tolist() == [1, 0, 0, 1, 0]
+
+
+def test_empty_dataset(matches):
+    index = app.build_match_index(matches.iloc[0:0])
+    assert index['records'] == []
+    assert app.team_rows(index, ['Persib']).tolist() == []
+    assert isinstance(index['incidence'], np.ndarray)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def test_text_columns_are_stripped(matches):
+    assert matches['Home'].tolist()[:2] == ['Persebaya', 'PSS Sleman']
+    assert matches['Away'].tolist()[0] == 'PERSIS'
+
+
+def test_jam_drops_seconds(matches):
+    assert matches['Jam'].tolist()[:3] == ['19:00', '19:00', '15:30']
+
+
+def test_both_date_formats_are_parsed(matches):
+    dates = matches['Tanggal Parsed'].to_numpy(dtype='datetime64[D]')
+    assert dates[:4].tolist() == [np.datetime64(day, 'D').item() for day in
+                                  ('2025-01-03', '2025-01-17', '2025-02-03', '2025-02-10')]
+    assert np.isnat(dates[4])
+    # The original text is kept for the responses
+    assert matches['Tanggal'].tolist()[4] == 'TBD'
+
+
+def test_bad_numbers_and_missing_text(raw_matches):
+    raw_matches['Jumlah Tiket Terjual'] = raw_matches['Jumlah Tiket Terjual'].astype(object)
+    raw_matches.loc[0, 'Jumlah Tiket Terjual'] = 'n/a'
+    raw_matches.loc[1, 'Lokasi'] = None
+    matches = app.normalize_dataset(raw_matches)
+    assert matches['Jumlah Tiket Terjual'].tolist()[:2] == [0, 7879]
+    assert pd.api.types.is_integer_dtype(matches['Jumlah Tiket Terjual'])
+    assert matches['Lokasi'].tolist()[1] == ''
+
+
+def test_category_columns(matches):
+    for column in app.DATASET_CATEGORY_COLUMNS:
+        assert isinstance(matches[column].dtype, pd.CategoricalDtype)
+
+
+def test_input_is_not_modified(raw_matches):
+    before = raw_matches.copy()
+    app.normalize_dataset(raw_matches)
+    pd.testing.assert_frame_equal(raw_matches, before)
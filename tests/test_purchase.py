@@ -0,0 +1,56 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import app
+
+TODAY = date(2025, 1, 10)
+
+
+def test_match_fields_come_from_the_dataset(match_index):
+    purchase = app.build_purchase(match_index, {
+        'match_id': '3',
+        'ticket_quantity': 2,
+        'home_team': 'Forged FC',
+        'stadium': 'Somewhere else'
+    }, TODAY)
+    assert purchase == {
+        'match_id': 3,
+        'home_team': 'Persib',
+        'away_team': 'PSS Sleman',
+        'stadium': 'Stadion GBLA',
+        'match_date': '2025-02-03',
+        'purchase_date': '2025-01-10',
+        'ticket_quantity': 2
+    }
+
+
+def test_undated_match_keeps_its_text_date(match_index):
+    purchase = app.build_purchase(match_index, {'match_id': 5, 'ticket_quantity': 1, 'purchase_date': '2025-01-05'}, TODAY)
+    assert purchase['match_date'] == 'TBD'
+    assert purchase['purchase_date'] == '2025-01-05'
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'match_id': 'abc', 'ticket_quantity': 1}, 'match_id must be an integer'),
+    ({'match_id': 99, 'ticket_quantity': 1}, 'Unknown match_id: 99'),
+    ({'match_id': 1, 'ticket_quantity': 0}, 'ticket_quantity'),
+    ({'match_id': 1, 'ticket_quantity': '3'}, 'ticket_quantity'),
+    ({'match_id': 1, 'ticket_quantity': 2.0}, 'ticket_quantity'),
+    ({'match_id': 1, 'ticket_quantity': True}, 'ticket_quantity'),
+    ({'match_id': 1, 'ticket_quantity': None}, 'ticket_quantity'),
+    ({'match_id': 1, 'ticket_quantity': 1, 'purchase_date': '10/01/2025'}, 'purchase_date'),
+])
+def test_invalid_input(match_index, data, message):
+    with pytest.raises(ValueError, match=message):
+        app.build_purchase(match_index, data, TODAY)
+
+
+def test_match_row_uses_the_first_of_repeated_ids(matches):
+    index = app.build_match_index(pd.concat([matches, matches.iloc[[0]]], ignore_index=True))
+    assert app.match_row(index, 1) == 0
+    assert app.match_row(index, ' 5 ') == 4
+    assert app.match_row(index, 99) is None
+    with pytest.raises(ValueError):
+        app.match_row(index, '1.5')
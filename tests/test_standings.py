@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app
+
+
+class Upstream:
+    """State of the stub standings server: /short redirects to /standings, which
+    answers 304 to a matching If-None-Match."""
+
+    def __init__(self):
+        self.data = {'standings': [{'team': 'Persib', 'points': 30}]}
+        self.etag = '"v1"'
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    state = Upstream()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state.requests.append((self.path, self.headers.get('If-None-Match')))
+            if self.path == '/short':
+                self.send_response(302)
+                self.send_header('Location', '/standings')
+                self.end_headers()
+                return
+            state.release.wait(5)
+            if self.headers.get('If-None-Match') == state.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = json.dumps(state.data).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', state.etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    monkeypatch.setattr(app, 'STANDINGS_URL', f"http://127.0.0.1:{server.server_port}/short")
+    monkeypatch.setattr(app, 'STANDINGS_CACHE_PATH', str(tmp_path / 'standings.json'))
+    monkeypatch.setattr(app, 'standings_cache', app.load_standings_from_disk())
+    yield state
+    state.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def expire():
+    app.standings_cache = {**app.standings_cache, 'fetched_at': 0}
+
+
+def test_redirect_target_is_reused(upstream):
+    assert app.get_standings_data() == upstream.data
+    assert [path for path, _ in upstream.requests] == ['/short', '/standings']
+
+    expire()
+    upstream.requests.clear()
+    app.refresh_standings()
+    assert [path for path, _ in upstream.requests] == ['/standings']
+
+
+def test_unchanged_standings_are_revalidated_with_304(upstream):
+    app.get_standings_data()
+    expire()
+    upstream.requests.clear()
+
+    refreshed = app.refresh_standings()
+    assert upstream.requests == [('/standings', '"v1"')]
+    assert refreshed['data'] == upstream.data
+    assert refreshed['fetched_at'] > 0
+
+
+def test_stale_standings_are_served_while_revalidating(upstream):
+    old = app.get_standings_data()
+    expire()
+    upstream.data = {'standings': [{'team': 'Persib', 'points': 33}]}
+    upstream.etag = '"v2"'
+    upstream.release.clear()
+
+    # The upstream is held, yet the stale copy comes back straight away
+    started = time.monotonic()
+    assert app.get_standings_data() == old
+    assert app.get_standings_data() == old
+    assert time.monotonic() - started < 1
+
+    upstream.release.set()
+    deadline = time.monotonic() + 5
+    while app.standings_cache['data'] != upstream.data and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert app.get_standings_data() == upstream.data
+    # A single revalidation was in flight
+    assert len([path for path, _ in upstream.requests if path == '/standings']) == 2
+
+
+def test_last_good_copy_survives_a_restart(upstream):
+    app.get_standings_data()
+    reloaded = app.load_standings_from_disk()
+    assert reloaded['data'] == upstream.data
+    assert reloaded['fetched_at'] == 0
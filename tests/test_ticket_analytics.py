@@ -0,0 +1,51 @@
+import gzip
+import json
+
+import app
+
+
+def test_team_totals_count_both_sides(matches):
+    teams = app.build_ticket_analytics(matches)['team']
+    assert teams['persebaya'] == {
+        'team': 'Persebaya',
+        'matches': 2,
+        'tiket_terjual': 24863,
+        'average_tiket_terjual': 12431.5,
+        'home_matches': 2,
+        'home_tiket_terjual': 24863
+    }
+    assert teams['persis']['tiket_terjual'] == 5863
+    assert teams['persis']['home_matches'] == 0
+    # Best-selling first
+    assert list(teams) == ['persib', 'persebaya', 'pss sleman', 'borneo fc', 'persis']
+
+
+def test_stadium_totals_carry_their_location(matches):
+    stadiums = app.build_ticket_analytics(matches)['stadium']
+    assert stadiums['stadion gelora bung tomo']['matches'] == 2
+    assert stadiums['stadion gelora bung tomo']['tiket_terjual'] == 24863
+    assert stadiums['stadion gelora bung tomo']['lokasi'] == 'Surabaya'
+
+
+def test_months_skip_undated_matches(matches):
+    months = app.build_ticket_analytics(matches)['month']
+    assert list(months) == ['2025-01', '2025-02']
+    assert months['2025-01']['tiket_terjual'] == 4863 + 7879
+    assert sum(entry['matches'] for entry in months.values()) == 4
+
+
+def test_fixture_order_is_by_tickets_sold(matches):
+    assert app.build_ticket_analytics(matches)['fixture_order'].tolist() == [3, 2, 1, 0, 4]
+
+
+def test_list_responses_are_serialized_once(matches):
+    response = app.build_ticket_analytics(matches)['responses']['team']
+    body = json.loads(response['variants']['identity'])
+    assert body['status'] is True
+    assert [entry['team'] for entry in body['data']] == ['Persib', 'Persebaya', 'PSS Sleman', 'Borneo FC', 'PERSIS']
+    assert gzip.decompress(response['variants']['gzip']) == response['variants']['identity']
+    assert response['etags']['gzip'] == f"{response['etag']}-gzip"
+
+
+def test_empty_dataset(matches):
+    assert app.build_ticket_analytics(matches.iloc[0:0]) is None